@@ -0,0 +1,455 @@
+import pygame
+import numpy as np
+import random
+import math
+
+from enum import IntEnum
+from typing import Any, Callable
+
+try:
+  from .elems     import Element
+  from .particles import ParticlePool, PARAMETER_TYPES
+  from .render    import DEFAULT, GLOW_Z
+  from .tilemap   import TileSHMap
+except:
+  from elems      import Element
+  from particles  import ParticlePool, PARAMETER_TYPES
+  from render     import DEFAULT, GLOW_Z
+  from tilemap    import TileSHMap
+
+# name -> dtype of every attribute an array particle has
+PARTICLE_FIELDS : dict[str, Any] = {
+  'x':np.float32,
+  'y':np.float32,
+  'vx':np.float32,
+  'vy':np.float32,
+  'age':np.float32,
+  'life':np.float32,
+  'size':np.float32,
+  'r':np.uint8,
+  'g':np.uint8,
+  'b':np.uint8,
+  'a':np.uint8
+}
+
+class ArrayParticlePool(ParticlePool):
+  'particle pool storing each particle attribute in its own numpy array, alive particles are packed at the front and updated by vectorized kernels'
+
+  def __init__(self, pool_size:int=0, fields:dict[str, Any]=None, kernels:list[Callable]=None):
+    super().__init__(None, 0)
+    self.capacity : int                   = pool_size
+    self.fields   : dict[str, Any]        = {**PARTICLE_FIELDS, **(fields if fields else {})}
+    self.arrays   : dict[str, np.ndarray] = {name:np.zeros(pool_size, dtype) for name, dtype in self.fields.items()}
+
+    # kernel(alive, dt) is called every update with views of the alive particles to change in place
+    self.kernels  : list[Callable]        = kernels if kernels else []
+    self.rng      : np.random.Generator   = np.random.default_rng()
+
+    # with a tile collider attached a step is split so no particle moves further than max_step seconds at once, up to max_substeps times
+    self.max_step     : float = 1 / 60
+    self.max_substeps : int   = 8
+
+  @property
+  def alive(self) -> dict[str, np.ndarray]:
+    'returns name -> view of the array of every attribute over the alive particles'
+    return {name:array[:self.particle_index] for name, array in self.arrays.items()}
+
+  @property
+  def alive_particles(self) -> range:
+    'indices of the alive particles in the arrays'
+    return range(self.particle_index)
+
+  @property
+  def available(self) -> int:
+    'number of unused and available particles from the pool'
+    return self.capacity - self.particle_index
+
+  def get_next(self, force:bool=False) -> int:
+    'returns the array index of the next available particle, otherwise returns none'
+    if self.available > 0:
+      self.particle_index += 1
+      return self.particle_index - 1
+
+    # none available but forcing one to be available, an alive particle is overwritten
+    elif force and self.capacity > 0:
+      return random.randint(0, self.capacity - 1)
+
+    return None
+
+  def modify_size(self, new_size:int) -> None:
+    'resizes the particle pool, dropping the newest particles if it shrinks below the alive count'
+    for name, array in self.arrays.items():
+      resized = np.zeros(new_size, array.dtype)
+      keep = min(new_size, self.capacity)
+      resized[:keep] = array[:keep]
+      self.arrays[name] = resized
+
+    self.capacity = new_size
+    self.particle_index = min(self.particle_index, new_size)
+
+  def change_particle_type(self, p_type:object) -> None:
+    'array pools have no particle type, behaviour comes from kernels'
+    raise TypeError('array particle pools are customised with kernels, not particle types')
+
+  def add_kernel(self, kernel:Callable) -> None:
+    'adds a kernel(alive, dt) run every update after movement, alive being name -> view of the alive particles'
+    self.kernels.append(kernel)
+
+  def create_particle(self, src:tuple, force:bool=False, **kwargs) -> None:
+    'creates a particle from the pool, keyword arguments being values of its attributes'
+    i = self.get_next(force)
+    if i == None:
+      return
+
+    self.arrays['x'][i] = src[0]
+    self.arrays['y'][i] = src[1]
+    self.arrays['age'][i] = 0
+    for name, value in kwargs.items():
+      self.arrays[name][i] = value
+
+  def sample_params(self, count:int, params:dict, flags:dict) -> dict:
+    'returns parameter -> array of count values drawn at random in one call per parameter, passed through parameters stay single values'
+    samples = {}
+    for parameter, value in params.items():
+      if flags[parameter] == PARAMETER_TYPES.RANDI:
+        samples[parameter] = self.rng.integers(value[0], value[1], count, endpoint=True)
+      elif flags[parameter] == PARAMETER_TYPES.RANDF:
+        samples[parameter] = self.rng.uniform(value[0], value[1], count)
+      else:
+        samples[parameter] = value
+    return samples
+
+  def spread_emission(self, count:int, due:int, start:float, span:float, src_from:pygame.Vector2, src_to:pygame.Vector2, dt:float) -> tuple[np.ndarray, np.ndarray]:
+    'returns the srcs and ages of count of due particles spread evenly between src_from and src_to as arrays, computed for every particle at once'
+    t = np.minimum((start + np.arange(0, due * count, due) // count) / span, 1).astype(np.float32)
+    srcs = np.column_stack((src_from.x + (src_to.x - src_from.x) * t, src_from.y + (src_to.y - src_from.y) * t))
+    return srcs, (1 - t) * dt
+
+  def create_particles(self, count:int, src:tuple, force:bool=False, ages:list[float]=None, **kwargs) -> None:
+    'creates count particles from the pool in one contiguous slice at src or a list of one src per particle, keyword arguments being single values or arrays of one value per particle. particles given ages are moved along their velocity as if they had been alive that long'
+    start = self.particle_index
+    created = min(count, self.available)
+    self.particle_index += created
+    indices = slice(start, start + created)
+
+    # forced particles that do not fit overwrite alive particles at random
+    if force and created < count and self.capacity > 0:
+      indices = np.concatenate([np.arange(start, start + created), self.rng.integers(0, self.capacity, count - created)])
+      created = count
+
+    src = np.asarray(src, np.float32)
+    if src.ndim == 2:
+      src = src[:created].T
+    self.arrays['x'][indices] = src[0]
+    self.arrays['y'][indices] = src[1]
+    self.arrays['age'][indices] = 0
+    for name, values in kwargs.items():
+      self.arrays[name][indices] = values[:created] if np.ndim(values) > 0 else values
+
+    if ages is not None:
+      ages = np.asarray(ages[:created], np.float32)
+      self.arrays['x'][indices] += self.arrays['vx'][indices] * ages
+      self.arrays['y'][indices] += self.arrays['vy'][indices] * ages
+      self.arrays['age'][indices] = ages
+
+  def update(self, dt:float=None) -> None:
+    'called every frame to move and age the particles by dt, the window frame time by default, run the kernels, remove dead particles and then tick the attached emitters. slept time is fast-forwarded in one step on waking'
+    if dt == None:
+      dt = self.elements['Window'].dt
+
+    view = self._get_view()
+    step = self._get_step(dt, view)
+    if step != None:
+      # one long step moves fast particles past thin walls before the collider sees them
+      substeps = 1
+      if any(isinstance(kernel, TileCollider) for kernel in self.kernels):
+        substeps = min(max(math.ceil(step / self.max_step), 1), self.max_substeps)
+
+      for _ in range(substeps):
+        self._simulate(step / substeps)
+
+    # emitted last since emitters already age new particles by the part of the frame they were alive for
+    for emitter in self.emitters:
+      emitter.update(dt, view)
+
+  def _get_bounds(self) -> pygame.Rect:
+    'returns the rect around every alive particle, otherwise returns none if none are alive'
+    if self.particle_index == 0:
+      return None
+
+    alive = self.alive
+    left, top = float(alive['x'].min()), float(alive['y'].min())
+    return pygame.Rect(left, top, float(alive['x'].max()) - left + 1, float(alive['y'].max()) - top + 1)
+
+  def _simulate(self, dt:float) -> None:
+    'moves and ages the particles by dt, runs the kernels and removes dead particles'
+    if self.particle_index == 0:
+      return
+
+    alive = self.alive
+    alive['x'] += alive['vx'] * dt
+    alive['y'] += alive['vy'] * dt
+    alive['age'] += dt
+
+    for kernel in self.kernels:
+      kernel(alive, dt)
+
+    self._compact(alive['age'] < alive['life'])
+
+  def _compact(self, keep:np.ndarray) -> None:
+    'moves the particles flagged in keep to the front of the arrays in order, dropping the rest'
+    count = int(np.count_nonzero(keep))
+    if count == self.particle_index:
+      return
+
+    for name, array in self.arrays.items():
+      array[:count] = array[:self.particle_index][keep]
+    self.particle_index = count
+
+def gravity(strength:float) -> Callable:
+  'returns a kernel accelerating every particle downwards by strength per second'
+  def kernel(alive:dict[str, np.ndarray], dt:float) -> None:
+    alive['vy'] += strength * dt
+  return kernel
+
+def drag(factor:float) -> Callable:
+  'returns a kernel slowing every particle by factor of its velocity per second'
+  def kernel(alive:dict[str, np.ndarray], dt:float) -> None:
+    scale = max(1 - factor * dt, 0)
+    alive['vx'] *= scale
+    alive['vy'] *= scale
+  return kernel
+
+def fade() -> Callable:
+  'returns a kernel fading the alpha of every particle out over its life'
+  def kernel(alive:dict[str, np.ndarray], dt:float) -> None:
+    alive['a'][:] = 255 * np.clip(1 - alive['age'] / np.maximum(alive['life'], 1e-6), 0, 1)
+  return kernel
+
+# used by the tile collider
+class COLLISION_RESPONSES(IntEnum):
+  BOUNCE = 1
+  STOP = 2
+  KILL = 3
+
+class TileCollider(Element):
+  'kernel colliding every particle of an array pool with the tiles of a tile map at once, looking up each occupied chunk once per update'
+
+  def __init__(self, tilemap:TileSHMap, response:COLLISION_RESPONSES=COLLISION_RESPONSES.BOUNCE, restitution:float=0.5):
+    super().__init__()
+    self.tilemap     : TileSHMap           = tilemap
+    self.response    : COLLISION_RESPONSES = response
+    self.restitution : float               = restitution
+
+    # chunk tag -> (chunk version, boolean grid array) so unchanged chunks are not converted again
+    self.grids : dict[str, tuple[int, np.ndarray]] = {}
+
+  def _get_grid(self, chunk_tag:str) -> np.ndarray:
+    'returns the occupancy of a chunk as a boolean array indexed [row, col], otherwise returns none if the chunk is empty'
+    chunk = self.tilemap.chunks.get(chunk_tag, None)
+    if chunk == None:
+      self.grids.pop(chunk_tag, None)
+      return None
+
+    cached = self.grids.get(chunk_tag, None)
+    if cached == None or cached[0] != chunk.version:
+      cached = (chunk.version, np.array(chunk.grid, bool))
+      self.grids[chunk_tag] = cached
+    return cached[1]
+
+  def check(self, xs:np.ndarray, ys:np.ndarray) -> np.ndarray:
+    'returns a boolean array of which world positions are inside a tile'
+    width = self.tilemap.CHUNK_WIDTH
+    cols = np.floor(xs / self.tilemap.TILE_SIZE).astype(np.int64)
+    rows = np.floor(ys / self.tilemap.TILE_SIZE).astype(np.int64)
+    chunkxs, chunkys = cols // width, rows // width
+
+    # every distinct chunk is looked up once, its grid stacked so all positions are read in one index
+    keys, inverse = np.unique((chunkxs << 32) + (chunkys & 0xffffffff), return_inverse=True)
+    grids = np.zeros((len(keys) + 1, width, width), bool)
+    for i, key in enumerate(keys.tolist()):
+      grid = self._get_grid(self.tilemap._format_chunk_tag(key >> 32, (key & 0xffffffff) - ((key & 0x80000000) << 1)))
+      if grid is not None:
+        grids[i] = grid
+
+    return grids[inverse, rows - chunkys * width, cols - chunkxs * width]
+
+  def __call__(self, alive:dict[str, np.ndarray], dt:float) -> None:
+    'called as a kernel after movement, applies the collision response to every particle that moved into a tile'
+    if len(alive['x']) == 0:
+      return
+
+    hit = self.check(alive['x'], alive['y'])
+    if not hit.any():
+      return
+
+    if self.response == COLLISION_RESPONSES.KILL:
+      alive['age'][hit] = alive['life'][hit]
+      return
+
+    # back up along the axes that moved into the tile, both if neither alone did (a corner)
+    x, y, vx, vy = alive['x'][hit], alive['y'][hit], alive['vx'][hit], alive['vy'][hit]
+    px, py = x - vx * dt, y - vy * dt
+    block_x = self.check(x, py)
+    block_y = self.check(px, y)
+    corner = ~(block_x | block_y)
+    block_x |= corner
+    block_y |= corner
+
+    scale = -self.restitution if self.response == COLLISION_RESPONSES.BOUNCE else 0
+    alive['x'][hit] = np.where(block_x, px, x)
+    alive['y'][hit] = np.where(block_y, py, y)
+    alive['vx'][hit] = np.where(block_x, vx * scale, vx)
+    alive['vy'][hit] = np.where(block_y, vy * scale, vy)
+
+class ParticleRenderer(Element):
+  'draws the particles of array pools as sprites pre-rendered at quantized size, colour and alpha steps, a whole pool in one blits call'
+
+  def __init__(self, size_step:float=1, color_step:int=32, alpha_step:int=32, cache_limit:int=16384):
+    super().__init__()
+    self.size_step   : float = size_step
+    self.color_step  : int   = color_step
+    self.alpha_step  : int   = alpha_step
+    self.cache_limit : int   = cache_limit
+
+    # (glow, packed size, colour and alpha steps) -> sprite
+    self.sprites : dict[tuple, pygame.Surface] = {}
+
+  def _make_sprite(self, glow:bool, radius:int, color:tuple, alpha:int) -> pygame.Surface:
+    'returns a circle sprite, glow sprites fade out from the centre and have their colour scaled by alpha for additive blending'
+    if not glow:
+      surf = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+      pygame.draw.circle(surf, (*color, alpha), (radius, radius), radius)
+      return surf
+
+    surf = pygame.Surface((radius * 2, radius * 2))
+    for i in range(radius, 0, -1):
+      intensity = alpha / 255 * (1 - (i - 1) / radius)
+      pygame.draw.circle(surf, [int(c * intensity) for c in color], (radius, radius), i)
+    return surf
+
+  def _get_level(self, bucket:int, step:int) -> int:
+    'returns the 0 to 255 value drawn for a quantized bucket, the first bucket being 0 and the last 255'
+    return min(round(bucket * 255 / max(255 // step, 1)), 255)
+
+  def _get_sprite(self, glow:bool, key:int) -> pygame.Surface:
+    'returns the sprite of a packed quantized key, rendering it on first use'
+    if (glow, key) not in self.sprites:
+      if len(self.sprites) >= self.cache_limit:
+        self.sprites.clear()
+
+      size, r, g, b, a = key >> 32, key >> 24 & 255, key >> 16 & 255, key >> 8 & 255, key & 255
+      radius = max(round(size * self.size_step / 2), 1)
+      color = [self._get_level(c, self.color_step) for c in (r, g, b)]
+      self.sprites[(glow, key)] = self._make_sprite(glow, radius, color, self._get_level(a, self.alpha_step))
+
+    return self.sprites[(glow, key)]
+
+  def get_blits(self, pool:ArrayParticlePool, offset:tuple=(0, 0), glow:bool=False) -> list[tuple]:
+    'returns the (sprite, position) blit sequence of every alive particle of pool, offset being subtracted from world positions'
+    alive = pool.alive
+    if pool.particle_index == 0:
+      return []
+
+    # quantize every particle at once into one integer key and only look up the sprite of each distinct key
+    size = np.maximum(np.rint(alive['size'] / self.size_step), 1).astype(np.int64)
+    keys = size << 32
+    keys |= (alive['r'] // self.color_step).astype(np.int64) << 24
+    keys |= (alive['g'] // self.color_step).astype(np.int64) << 16
+    keys |= (alive['b'] // self.color_step).astype(np.int64) << 8
+    keys |= (alive['a'] // self.alpha_step).astype(np.int64)
+    xs, ys = alive['x'], alive['y']
+
+    # the first alpha bucket is drawn fully transparent so it is not drawn at all
+    shown = (keys & 255) != 0
+    if not shown.all():
+      keys, size, xs, ys = keys[shown], size[shown], xs[shown], ys[shown]
+      if len(keys) == 0:
+        return []
+
+    keys, inverse = np.unique(keys, return_inverse=True)
+
+    sprites = np.empty(len(keys), object)
+    sprites[:] = [self._get_sprite(glow, key) for key in keys.tolist()]
+
+    radii = np.maximum(np.rint(size * self.size_step / 2), 1)
+    xs = (xs - radii - offset[0]).astype(np.int32).tolist()
+    ys = (ys - radii - offset[1]).astype(np.int32).tolist()
+    return list(zip(sprites[inverse].tolist(), zip(xs, ys)))
+
+  def render(self, surf:pygame.Surface, pool:ArrayParticlePool, offset:tuple=(0, 0), glow:bool=False) -> None:
+    'draws every alive particle of pool onto surf in one blits call, glow particles are blended additively'
+    blits = self.get_blits(pool, offset, glow)
+    if glow:
+      blits = [(sprite, pos, None, pygame.BLEND_RGBA_ADD) for sprite, pos in blits]
+    surf.blits(blits, doreturn=False)
+
+  def draw(self, pool:ArrayParticlePool, offset:tuple=(0, 0), z:int=0, group:str=DEFAULT) -> None:
+    'queues the particles of pool in the render singleton as one entry, at GLOW_Z they are drawn as additive glows'
+    self.elements['Render'].drawf(self.render, pool, offset, z == GLOW_Z, z=z, group=group)
+
+if __name__ == '__main__':
+  import time
+
+  try:
+    from .particles import Particle
+  except:
+    from particles  import Particle
+
+  class BenchParticle(Particle):
+    'object particle doing the same work as the array pool with gravity'
+
+    def set_kwargs(self, vx:float=0, vy:float=0, life:float=1) -> None:
+      self.vel = pygame.Vector2(vx, vy)
+      self.age = 0
+      self.life = life
+
+    def update(self) -> None:
+      self.vel.y += 100 * DT
+      self.pos += self.vel * DT
+      self.age += DT
+
+    def is_dead(self) -> bool:
+      return self.age >= self.life
+
+  DT = 1 / 60
+  FRAMES = 60
+
+  for count in [10000, 100000]:
+    object_pool = ParticlePool(BenchParticle, count)
+    array_pool = ArrayParticlePool(count, kernels=[gravity(100)])
+    for _ in range(count):
+      params = {'vx':random.uniform(-50, 50), 'vy':random.uniform(-50, 50), 'life':random.uniform(2, 4)}
+      object_pool.create_particle((0, 0), **params)
+      array_pool.create_particle((0, 0), **params)
+
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+      object_pool.update(DT)
+    object_time = (time.perf_counter() - start) / FRAMES
+
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+      array_pool.update(DT)
+    array_time = (time.perf_counter() - start) / FRAMES
+
+    print(f'{count:>6} particles: object pool {object_time * 1000:8.2f} ms/frame, array pool {array_time * 1000:6.2f} ms/frame, {object_time / array_time:6.1f}x')
+
+  # one explosion worth of particles emitted in a single frame
+  BURST = 500
+  for pool in [ParticlePool(BenchParticle, BURST), ArrayParticlePool(BURST)]:
+    emitter = pool.create_emitter(0, burst_size=BURST)
+    emitter.set_emit_params({'vx':(-50, 50), 'vy':(-50, 50), 'life':(2, 4)}, {'vx':PARAMETER_TYPES.RANDF, 'vy':PARAMETER_TYPES.RANDF, 'life':PARAMETER_TYPES.RANDF})
+
+    start = time.perf_counter()
+    emitter.burst(BURST)
+    print(f'{BURST} particle burst: {pool.__class__.__name__} {(time.perf_counter() - start) * 1000:.3f} ms')
+
+  # an emit delay of 0 bursts once every update
+  for pool in [ParticlePool(BenchParticle, 30), ArrayParticlePool(30)]:
+    emitter = pool.create_emitter(0, burst_size=10)
+    emitter.set_emit_params({'life':10})
+    emitter.toggle_emit(True)
+    for _ in range(3):
+      pool.update(DT)
+    assert pool.available == 0, f'{pool.__class__.__name__} emitted {30 - pool.available} of 30 particles'
@@ -0,0 +1,250 @@
+import pygame
+import hashlib
+import struct
+import threading
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+  from .elems import Element
+  from .spatialhash import Chunk
+except:
+  from elems  import Element
+  from spatialhash import Chunk
+
+# region file: magic, then records of a header followed by a pixel blob
+REGION_MAGIC  : bytes = b'BKC2'
+
+# record header: content key, chunk x, chunk y, surface width, surface height, pixel blob length
+RECORD_HEADER : struct.Struct = struct.Struct('<20siiHHI')
+
+# key of a record being rewritten, a crash mid rewrite leaves a record nothing matches
+EMPTY_KEY     : bytes = bytes(20)
+
+class BakeCache(Element):
+  'persistent cache of baked chunk surfaces, stored as raw pixel blobs in region files on disk. every chunk position has one record, rewritten in place when the chunk is baked again, and writes happen on a background thread'
+
+  def __init__(self, path:str, region_width:int=16, compact_ratio:float=0.5):
+    super().__init__()
+    self.path          : str   = path
+    self.region_width  : int   = region_width
+    self.compact_ratio : float = compact_ratio
+
+    # region path -> chunk pos -> (key, offset, w, h, length) and region path -> bytes of records nothing points at
+    self.indices       : dict  = {}
+    self.dead          : dict  = {}
+
+    # (region path, chunk pos) -> (key, surface) stored but not written yet, loads are served from here until it is
+    self.pending       : dict  = {}
+
+    # guards the indices and region files, shared by the calling thread and the writer
+    self.lock          : threading.Lock     = threading.Lock()
+    self._writer       : ThreadPoolExecutor = None
+
+    os.makedirs(path, exist_ok=True)
+
+  def _get_region_path(self, chunk:Chunk) -> str:
+    'returns the path of the region file holding chunk'
+    regionx = int(chunk.chunk_pos.x) // self.region_width
+    regiony = int(chunk.chunk_pos.y) // self.region_width
+    return os.path.join(self.path, f'r.{regionx}.{regiony}.bin')
+
+  def _get_index(self, region_path:str) -> dict:
+    'returns the index of chunk pos -> (key, offset, w, h, length) of a region file, reading only record headers on first use. the lock must be held'
+    if region_path in self.indices:
+      return self.indices[region_path]
+
+    index = {}
+    dead = 0
+    if os.path.exists(region_path):
+      size = os.path.getsize(region_path)
+      with open(region_path, 'r+b') as f:
+        if f.read(len(REGION_MAGIC)) != REGION_MAGIC:
+          f.truncate(0)
+        else:
+          offset = len(REGION_MAGIC)
+          while offset < size:
+            header = f.read(RECORD_HEADER.size)
+
+            # a record cut short by a crash is dropped along with anything after it
+            if len(header) < RECORD_HEADER.size:
+              break
+            key, x, y, w, h, length = RECORD_HEADER.unpack(header)
+            if offset + RECORD_HEADER.size + length > size or length != w * h * 3:
+              break
+
+            if (x, y) in index:
+              dead += RECORD_HEADER.size + index[(x, y)][4]
+            if key == EMPTY_KEY:
+              dead += RECORD_HEADER.size + length
+              index.pop((x, y), None)
+            else:
+              index[(x, y)] = (key, offset + RECORD_HEADER.size, w, h, length)
+
+            offset += RECORD_HEADER.size + length
+            f.seek(offset)
+
+          if offset < size:
+            f.truncate(offset)
+
+    self.indices[region_path] = index
+    self.dead[region_path] = dead
+    return index
+
+  def _get_writer(self) -> ThreadPoolExecutor:
+    'returns the worker writing stored surfaces to disk'
+    if self._writer == None:
+      self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bake-cache')
+    return self._writer
+
+  def get_key(self, chunk:Chunk) -> bytes:
+    'returns the cache key of a chunk, a hash of its contents and every loaded sheet'
+    key = hashlib.sha1()
+    key.update(f'{chunk.chunk_width},{chunk.tile_size},{chunk.__class__.__name__}|'.encode())
+    key.update(str(chunk.get_save_data()).encode())
+    key.update(self.elements['Sheets'].get_sheets_hash().encode())
+    return key.digest()
+
+  def load(self, chunk:Chunk) -> pygame.Surface:
+    'returns the cached surface baked from chunk\'s current contents, otherwise returns none'
+    region_path = self._get_region_path(chunk)
+    pos = (int(chunk.chunk_pos.x), int(chunk.chunk_pos.y))
+    key = self.get_key(chunk)
+
+    with self.lock:
+      pending = self.pending.get((region_path, pos), None)
+      if pending != None:
+        return pending[1] if pending[0] == key else None
+
+      entry = self._get_index(region_path).get(pos, None)
+      if entry == None or entry[0] != key:
+        return None
+
+      _, offset, w, h, length = entry
+      with open(region_path, 'rb') as f:
+        f.seek(offset)
+        blob = f.read(length)
+
+    if len(blob) != length:
+      return None
+
+    surf = pygame.image.frombytes(blob, (w, h), 'RGB')
+    surf.set_colorkey((0, 0, 0))
+    return surf
+
+  def store(self, chunk:Chunk, surf:pygame.Surface) -> None:
+    'queues the baked surface of chunk to be written over the record of its position in the background'
+    region_path = self._get_region_path(chunk)
+    pos = (int(chunk.chunk_pos.x), int(chunk.chunk_pos.y))
+    key = self.get_key(chunk)
+
+    with self.lock:
+      entry = self._get_index(region_path).get(pos, None)
+      if entry != None and entry[0] == key:
+        return
+      self.pending[(region_path, pos)] = (key, surf)
+
+    self._get_writer().submit(self._write, region_path, pos, key, surf)
+
+  def _write(self, region_path:str, pos:tuple, key:bytes, surf:pygame.Surface) -> None:
+    'writes a stored surface over the record of its position, appending it if there is none of the same size. runs on the writer'
+    blob = pygame.image.tobytes(surf, 'RGB')
+    w, h = surf.get_size()
+
+    with self.lock:
+      # a later store for the same position replaces this one and has its own write queued
+      if self.pending.get((region_path, pos), (None,))[0] != key:
+        return
+
+      index = self._get_index(region_path)
+      entry = index.get(pos, None)
+      if entry != None and entry[4] == len(blob):
+        offset = entry[1]
+        with open(region_path, 'r+b') as f:
+          f.seek(offset - RECORD_HEADER.size)
+          f.write(RECORD_HEADER.pack(EMPTY_KEY, *pos, w, h, len(blob)))
+          f.write(blob)
+          f.seek(offset - RECORD_HEADER.size)
+          f.write(RECORD_HEADER.pack(key, *pos, w, h, len(blob)))
+      else:
+        if entry != None:
+          self.dead[region_path] += RECORD_HEADER.size + entry[4]
+
+        with open(region_path, 'ab') as f:
+          if f.tell() == 0:
+            f.write(REGION_MAGIC)
+          offset = f.tell() + RECORD_HEADER.size
+          f.write(RECORD_HEADER.pack(key, *pos, w, h, len(blob)))
+          f.write(blob)
+
+      index[pos] = (key, offset, w, h, len(blob))
+      del self.pending[(region_path, pos)]
+
+      if self.dead[region_path] <= self.compact_ratio * os.path.getsize(region_path):
+        return
+      index = dict(index)
+
+    # the region is rewritten without holding the lock so loads on the game thread only wait for the swap
+    self._compact_region(region_path, index, None)
+
+  def flush(self) -> None:
+    'waits for every stored surface to be written'
+    if self._writer != None:
+      self._writer.shutdown(wait=True)
+      self._writer = None
+
+  def _compact_region(self, region_path:str, index:dict, keep:set) -> None:
+    'rewrites a region file from a copy of its index with only its live records, those whose (chunk pos, key) is in keep if given. called by the writer or once the cache is flushed, since nothing else writes region files'
+    records = []
+    with open(region_path, 'rb') as f:
+      for pos, (key, offset, w, h, length) in index.items():
+        if keep != None and (pos, key) not in keep:
+          continue
+        f.seek(offset)
+        records.append((key, pos, w, h, f.read(length)))
+
+    # write to a temporary file first so an interrupted compaction keeps the old region
+    compacted = {}
+    if records != []:
+      with open(region_path + '.tmp', 'wb') as f:
+        f.write(REGION_MAGIC)
+        for key, pos, w, h, blob in records:
+          f.write(RECORD_HEADER.pack(key, *pos, w, h, len(blob)))
+          compacted[pos] = (key, f.tell(), w, h, len(blob))
+          f.write(blob)
+
+    with self.lock:
+      if records == []:
+        os.remove(region_path)
+      else:
+        os.replace(region_path + '.tmp', region_path)
+      self.indices[region_path] = compacted
+      self.dead[region_path] = 0
+
+  def compact(self, chunks:list[Chunk]) -> None:
+    'rewrites the region files keeping only the surfaces baked from the current contents of <chunks>'
+    self.flush()
+
+    keep = {}
+    for chunk in chunks:
+      pos = (int(chunk.chunk_pos.x), int(chunk.chunk_pos.y))
+      keep.setdefault(self._get_region_path(chunk), set()).add((pos, self.get_key(chunk)))
+
+    for name in os.listdir(self.path):
+      if name.startswith('r.') and name.endswith('.bin'):
+        region_path = os.path.join(self.path, name)
+        with self.lock:
+          index = dict(self._get_index(region_path))
+        self._compact_region(region_path, index, keep.get(region_path, set()))
+
+  def clear(self) -> None:
+    'deletes every region file of the cache'
+    self.flush()
+
+    with self.lock:
+      for name in os.listdir(self.path):
+        if name.startswith('r.') and name.endswith('.bin'):
+          os.remove(os.path.join(self.path, name))
+      self.indices.clear()
+      self.dead.clear()
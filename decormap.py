@@ -1,4 +1,5 @@
 import pygame
+import types
 
 from typing import Any
 
@@ -10,51 +11,163 @@ except:
   from utils        import point2d, contains, _base64chars
 
 class DecorChunk(Chunk):
+  'chunk element holding references to the decor stored in its decor map'
+
   def __init__(self, chunk_pos:point2d, chunk_width:int, tile_size:int):
     super().__init__(None, chunk_pos=chunk_pos, chunk_width=chunk_width, tile_size=tile_size)
-    self.textures     : list            = []
+    self.decor_ids    : list[int]       = []
+    self.store        : dict            = {}
     self.cached_surf  : pygame.Surface  = None
     self.surf_buffer  : int             = 2
 
   def get_textures(self) -> list:
     'returns list of (point2d, (sheet id, texture row, texture col)) of entire chunk'
-    return self.textures
-  
-  def add_decor(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int) -> None:
-    position = point2d(worldx, worldy)
-    self.textures.append((position, (sheet_id, tex_row, tex_col)))
+    return [self.store[decor_id] for decor_id in self.decor_ids]
+
+  def add_decor(self, decor_id:int) -> None:
+    'adds a reference to decor <decor_id> to this chunk'
+    self._own()
+    self.decor_ids.append(decor_id)
     self.count += 1
-    self.outdated = True
+    self.invalidate()
+
+  def del_decor(self, decor_id:int) -> None:
+    'removes the reference to decor <decor_id> from this chunk'
+    if decor_id not in self.decor_ids:
+      return
 
-  def del_decor(self, worldx:float, worldy:float) -> Any:
+    self._own()
+    self.decor_ids.remove(decor_id)
+    self.count -= 1
+    self.invalidate()
+
+  def find_decor(self, worldx:float, worldy:float) -> int:
+    'returns the id of the first decor in this chunk covering worldx, worldy, otherwise returns none'
     world_pos = point2d(worldx, worldy)
-    for i, (pos, (sheet_id, tex_row, tex_col)) in enumerate(self.textures):
+    for decor_id in self.decor_ids:
+      pos, (sheet_id, tex_row, tex_col) = self.store[decor_id]
       w, h = self.elements['Sheets'].get_texture_size(sheet_id, tex_row, tex_col)
       if contains(pos.x, pos.y, w, h, world_pos):
-        self.textures.pop(i)
-        self.count -= 1
-        self.outdated = True
-        return pos, sheet_id, tex_row, tex_col
-    return None, None
+        return decor_id
+    return None
+
+  def _own(self) -> None:
+    shared = self._shared
+    super()._own()
+    if shared:
+      self.decor_ids = self.decor_ids.copy()
 
   def get_chunk_texture(self) -> pygame.Surface:
     if self.outdated:
       self.cached_surf = pygame.Surface((self.chunk_size + self.surf_buffer, self.chunk_size + self.surf_buffer))
       self.cached_surf.set_colorkey((0, 0, 0))
 
-      for (pos, (sheet_id, tex_row, tex_col)) in self.textures:
+      for (pos, (sheet_id, tex_row, tex_col)) in self.get_textures():
         texture = self.elements['Sheets'].get_texture(sheet_id, tex_row, tex_col)
         self.cached_surf.blit(texture, (pos.x - self.chunk_pos.x * self.chunk_size + self.surf_buffer, pos.y - self.chunk_pos.y * self.chunk_size + self.surf_buffer))
 
       self.outdated = False
 
     return self.cached_surf
-  
-  def get_save_data(self) -> Any:
 
+
+class DecorSHMap(SpatialHashMap):
+  'spatial hash structure for storing decor. each decor is stored once and referenced by id from every chunk it overlaps'
+
+  def __init__(self, chunk_width:int=16, tile_size:int=16):
+    super().__init__(DecorChunk, chunk_width=chunk_width, tile_size=tile_size)
+
+    self.decor    : dict[int, tuple[point2d, tuple]] = {}
+    self._next_id : int = 0
+    self.version  : int = 0
+
+  def _create_chunk(self, chunk_pos:point2d, chunk_width:int, tile_size:int) -> DecorChunk:
+    chunk = super()._create_chunk(chunk_pos, chunk_width, tile_size)
+    chunk.store = self.decor
+    return chunk
+
+  def intern_chunk(self, chunk:DecorChunk) -> None:
+    'decor chunks hold decor ids rather than a grid so there is nothing to share'
+    return
+
+  def _get_decor_rect(self, decor_id:int) -> pygame.Rect:
+    'returns the world rect covered by decor <decor_id>'
+    pos, (sheet_id, tex_row, tex_col) = self.decor[decor_id]
+    w, h = self.elements['Sheets'].get_texture_size(sheet_id, tex_row, tex_col)
+    return pygame.Rect(pos.x, pos.y, w, h)
+
+  def get_decor(self, decor_id:int) -> tuple[point2d, tuple]:
+    'returns the (position, (sheet id, texture row, texture col)) of decor <decor_id>, otherwise returns none'
+    return self.decor.get(decor_id, None)
+
+  def add_tile(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int) -> int:
+    'adds decor to the world at worldx, worldy and returns its id'
+    decor_id = self._next_id
+    self._next_id += 1
+    self.version += 1
+    self.decor[decor_id] = (point2d(worldx, worldy), (sheet_id, tex_row, tex_col))
+
+    for chunk_tag in self.get_chunks_in_rect(self._get_decor_rect(decor_id), pad=False, include_empty=True):
+
+      if chunk_tag not in self.chunks:
+        chunk_pos = point2d(*self._unformat_chunk_tag(chunk_tag))
+        self.chunks[chunk_tag] = self._create_chunk(chunk_pos, self.CHUNK_WIDTH, self.TILE_SIZE)
+
+      self.chunks[chunk_tag].add_decor(decor_id)
+
+    return decor_id
+
+  def del_tile(self, worldx:float, worldy:float, del_empty:bool=True) -> Any:
+    'deletes the first decor covering worldx, worldy and returns its texture data'
+    chunk_tag = self.get_chunk_tag(worldx, worldy)
+
+    if chunk_tag not in self.chunks:
+      return None
+
+    decor_id = self.chunks[chunk_tag].find_decor(worldx, worldy)
+    if decor_id == None:
+      return None
+
+    return self.del_decor(decor_id, del_empty=del_empty)
+
+  def del_decor(self, decor_id:int, del_empty:bool=True) -> Any:
+    'deletes decor <decor_id> from the store and every chunk referencing it and returns its texture data'
+    rect = self._get_decor_rect(decor_id)
+    _, data = self.decor.pop(decor_id)
+    self.version += 1
+
+    for chunk_tag in self.get_chunks_in_rect(rect, pad=False):
+      self.chunks[chunk_tag].del_decor(decor_id)
+
+      if del_empty and self.chunks[chunk_tag].count == 0:
+        del self.chunks[chunk_tag]
+
+    return list(data)
+
+  def snapshot(self) -> 'DecorSHMap':
+    hashmap = super().snapshot()
+    hashmap.decor = types.MappingProxyType(self.decor.copy())
+    for chunk in hashmap.chunks.values():
+      chunk.store = hashmap.decor
+    return hashmap
+
+  def get_terrain(self, query:pygame.Rect, pad:bool=True) -> list[Any]:
+    tags = self.get_chunks_in_rect(query, pad)
+
+    textures = []
+    for tag in tags:
+      chunk_pos = self.chunks[tag].chunk_pos.copy()
+      chunk_pos.x *= self.CHUNK_SIZE
+      chunk_pos.y *= self.CHUNK_SIZE
+      textures.append((chunk_pos, self.chunks[tag].get_chunk_texture()))
+
+    return textures
+
+  def _encode_decor(self) -> str:
+    'returns the decor store as a compact string, every decor written once'
     data_str = ''
     tex_types = []
-    for (pos, data) in self.textures:
+    for (pos, data) in self.decor.values():
       data_id = 0
       if data not in tex_types:
         data_id = len(tex_types)
@@ -75,10 +188,9 @@ class DecorChunk(Chunk):
     tex_str = tex_str.removesuffix('.')
 
     return data_str + '|' + tex_str
-  
-  def reconstruct(self, data:Any) -> None:
-    super().reconstruct()
-    self.textures = []
+
+  def _decode_decor(self, data:str) -> list[tuple[point2d, tuple]]:
+    'returns list of (position, (sheet id, texture row, texture col)) from an encoded decor string'
     data_str, tex_str = data.split('|')
 
     # reconstruct texture data
@@ -91,73 +203,48 @@ class DecorChunk(Chunk):
 
       tex_data_types.append((sheet_id, tex_row, tex_col))
 
-    # reconstruct textures
-    textures = data_str.split(':')
-    for texture in textures:
+    # reconstruct decor
+    decor = []
+    for texture in data_str.split(':'):
+      if texture == '':
+        continue
+
       x, y, compressed_tex = texture.split(',')
 
       pos = point2d(float(x), float(y))
       tex_data = tex_data_types[_base64chars.index(compressed_tex)]
 
-      self.textures.append((pos, tex_data))
-
-
-class DecorSHMap(SpatialHashMap):
-  def __init__(self, chunk_width:int=16, tile_size:int=16):
-    super().__init__(DecorChunk, chunk_width=chunk_width, tile_size=tile_size)
-
-  def add_tile(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int) -> None:
-    w, h = self.elements['Sheets'].get_texture_size(sheet_id, tex_row, tex_col)
-
-    for chunk_tag in self.get_chunks_in_rect(pygame.Rect(worldx, worldy, w, h), pad=False, include_empty=True):
-
-      chunkx, chunky = self._unformat_chunk_tag(chunk_tag)
-
-      if chunk_tag not in self.chunks:
-        self.chunks[chunk_tag] = self.chunk_type(
-          point2d(chunkx, chunky),
-          self.CHUNK_WIDTH,
-          self.TILE_SIZE
-        )
-
-      self.chunks[chunk_tag].add_decor(worldx, worldy, sheet_id, tex_row, tex_col)
-
-  def del_tile(self, worldx:float, worldy:float, del_empty:bool=True) -> Any:
-    chunkx, chunky = self.get_chunk_pos(worldx, worldy)
-    chunk_tag = self._format_chunk_tag(chunkx, chunky)
-
-    if chunk_tag not in self.chunks:
-      return None
-    
-    pos, *data = self.chunks[chunk_tag].del_decor(worldx, worldy)
-    if pos == None:
-      return None
-
-    if del_empty and self.chunks[chunk_tag].count == 0:
-      del self.chunks[chunk_tag]
-
-    # using found decor size, search in possible chunks for leftovers
-    w, h = self.elements['Sheets'].get_texture_size(*data)
-    for chunk_tag in self.get_chunks_in_rect(pygame.Rect(pos.x, pos.y, w, h)):
-      
-      if chunk_tag not in self.chunks:
-        continue
-
-      self.chunks[chunk_tag].del_decor(worldx, worldy)
-      if self.chunks[chunk_tag].count == 0:
-        del self.chunks[chunk_tag]
+      decor.append((pos, tex_data))
 
-    return data
+    return decor
 
-  def get_terrain(self, query:pygame.Rect, pad:bool=True) -> list[Any]:
-    tags = self.get_chunks_in_rect(query, pad)
-    
-    textures = []
-    for tag in tags:
-      chunk_pos = self.chunks[tag].chunk_pos.copy()
-      chunk_pos.x *= self.CHUNK_SIZE
-      chunk_pos.y *= self.CHUNK_SIZE
-      textures.append((chunk_pos, self.chunks[tag].get_chunk_texture()))
-
-    return textures
-  
\ No newline at end of file
+  def get_save_data(self) -> Any:
+    return {
+      'width':self.CHUNK_WIDTH,
+      'size':self.TILE_SIZE,
+      'decor':self._encode_decor()
+    }
+
+  def load_from_data(self, data:Any) -> None:
+    self.clear_chunks()
+    self.decor.clear()
+    self._next_id = 0
+    self.version += 1
+
+    if 'decor' in data:
+      decor = self._decode_decor(data['decor'])
+
+    # older saves stored a copy of each decor in every chunk it overlapped
+    else:
+      decor = []
+      seen = set()
+      for chunk_tag in data['data']:
+        for pos, tex_data in self._decode_decor(data['data'][chunk_tag]):
+          key = (pos.x, pos.y, tex_data)
+          if key in seen:
+            continue
+          seen.add(key)
+          decor.append((pos, tex_data))
+
+    for pos, (sheet_id, tex_row, tex_col) in decor:
+      self.add_tile(pos.x, pos.y, sheet_id, tex_row, tex_col)
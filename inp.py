@@ -164,7 +164,7 @@ class MouseListener:
 class Input(Singleton):
   'singleton that controls all of the input handling for any game project'
 
-  def __init__(self, app_name:str, custom_cursor:callable=None):
+  def __init__(self, app_name:str, custom_cursor:callable=None, cursor_rect:pygame.Rect=None):
     super().__init__()
 
     self.app_name : str = app_name
@@ -172,6 +172,9 @@ class Input(Singleton):
     self.mouse : MouseListener = MouseListener()
     self.custom_cursor : bool = False
     self.custom_cursor_func : callable = None
+
+    # area the custom cursor draws in relative to the mouse position, lets dirty rect windows redraw only around it
+    self.cursor_rect : pygame.Rect = cursor_rect
     if custom_cursor:
       self.custom_cursor = True
       self.custom_cursor_func = bind_func(custom_cursor, position=self.mouse.pos)
@@ -193,11 +196,12 @@ class Input(Singleton):
   def update(self) -> None:
     'must be called every frame. clears pygame input buffer and triggers keybinds accordingly'
 
-    if self.custom_cursor:
-      self.elements['Render'].drawf(self.custom_cursor_func, z=1)
-
     self.mouse.update()
 
+    if self.custom_cursor:
+      dirty = self.cursor_rect.move(self.mouse.pos) if self.cursor_rect != None else None
+      self.elements['Render'].drawf(self.custom_cursor_func, z=1, dirty=dirty)
+
     # iterate over event buffer to obtain input events, may change later for event buffer stuff
     for event in pygame.event.get():
       if event.type == pygame.QUIT:
@@ -37,6 +37,58 @@ void main() {
 }
 '''
 
+copy_frag_shader = '''
+#version 330
+
+uniform sampler2D surf;
+
+in vec2 uv;
+out vec4 f_color;
+
+void main() {
+  f_color = texture(surf, uv);
+}
+'''
+
+# separable gaussian blur, run once along (1, 0) and once along (0, 1)
+blur_frag_shader = '''
+#version 330
+
+uniform sampler2D surf;
+uniform vec2 texel;
+uniform vec2 direction;
+
+in vec2 uv;
+out vec4 f_color;
+
+const float weights[5] = float[](0.227027, 0.1945946, 0.1216216, 0.054054, 0.016216);
+
+void main() {
+  vec2 offset = texel * direction;
+  vec4 color = texture(surf, uv) * weights[0];
+  for (int i = 1; i < 5; i++) {
+    color += texture(surf, uv + offset * i) * weights[i];
+    color += texture(surf, uv - offset * i) * weights[i];
+  }
+  f_color = color;
+}
+'''
+
+glow_frag_shader = '''
+#version 330
+
+uniform sampler2D surf;
+uniform sampler2D glow;
+uniform float intensity;
+
+in vec2 uv;
+out vec4 f_color;
+
+void main() {
+  f_color = vec4(texture(surf, uv).rgb + texture(glow, uv).rgb * intensity, 1.0);
+}
+'''
+
 class RenderTarget(Element):
   'a render target for the mgl rendering system'
 
@@ -45,6 +97,14 @@ class RenderTarget(Element):
     self.texture   : moderngl.Texture     = tex
     self.frame_buf : moderngl.Framebuffer = ctx.framebuffer(color_attachments=[tex])
 
+    # size and format the render target pool files it under
+    self.key : tuple = (tex.size, tex.components, tex.dtype)
+
+  def release(self) -> None:
+    'frees the gpu memory of the render target'
+    self.frame_buf.release()
+    self.texture.release()
+
 class RenderObject(Element):
   'shader program for rendering using specified vertex and fragment shaders'
 
@@ -129,13 +189,51 @@ class MGL(Singleton):
     self.default_vert : str = def_vert_shader
     self.default_frag : str = def_frag_shader
 
+    # (size, components, dtype) -> render targets free for reuse
+    self.targets : dict[tuple, list[RenderTarget]] = {}
+
   def create_render_target(self, tex:moderngl.Framebuffer=None) -> RenderTarget:
-    'returns a render target for the rendering system'
+    'returns a render target for the rendering system, taken from the pool at the window size if no texture is given'
     if tex == None:
-      tex = self.context.texture(self.elements['Window'].window.get_size(), 4)
+      return self.get_render_target()
 
     return RenderTarget(tex, self.context)
 
+  def get_render_target(self, size:tuple=None, components:int=4, dtype:str='f1') -> RenderTarget:
+    'returns a free render target of size, the window size if none, and format from the pool, allocating one if there is none. give it back with release_render_target'
+    size = tuple(size) if size != None else self.elements['Window'].window.get_size()
+    free = self.targets.get((size, components, dtype), [])
+    if free:
+      return free.pop()
+
+    # clamped so taps past the edge of the screen do not wrap around, filtered for passes sampling at another scale
+    texture = self.context.texture(size, components, dtype=dtype)
+    texture.repeat_x = False
+    texture.repeat_y = False
+    texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+    return RenderTarget(texture, self.context)
+
+  def release_render_target(self, target:RenderTarget) -> None:
+    'gives a render target back to the pool for reuse'
+    self.targets.setdefault(target.key, []).append(target)
+
+  def clear_render_targets(self) -> None:
+    'frees the gpu memory of every render target in the pool'
+    for free in self.targets.values():
+      for target in free:
+        target.release()
+    self.targets.clear()
+
+  def resize(self, size:tuple) -> None:
+    'called when the window is resized, frees the pooled render targets of the old size and draws to the whole new screen'
+    self.clear_render_targets()
+    if self.context.screen != None:
+      self.context.screen.viewport = (0, 0, *size)
+
+  def create_post_process(self) -> 'PostProcess':
+    'returns an empty post processing chain'
+    return PostProcess()
+
   def create_render_object_default(self) -> RenderObject:
     'returns a default shader program for rendering'
     return RenderObject(self.default_frag, default=True)
@@ -155,4 +253,126 @@ class MGL(Singleton):
     texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
     texture.swizzle = 'BGRA'
     texture.write(surf.get_view('1'))
-    return texture
\ No newline at end of file
+    return texture
+
+class PostPass(Element):
+  'one full screen pass of a post processing chain'
+
+  def __init__(self, name:str, render_obj:RenderObject, source:str=None, uniforms:dict=None, scale:float=1, dtype:str='f1'):
+    super().__init__()
+    self.name       : str          = name
+    self.render_obj : RenderObject = render_obj
+    self.source     : str          = source
+    self.uniforms   : dict         = uniforms if uniforms != None else {}
+    self.scale      : float        = scale
+    self.dtype      : str          = dtype
+
+class PostProcess(Element):
+  'ordered full screen passes run over the window surface, each drawn into a pooled render target read by the passes after it and given back to the pool once nothing later reads it'
+
+  def __init__(self):
+    super().__init__()
+    self.passes  : list[PostPass]              = []
+
+    # surfaces are uploaded through a copy pass that turns them the right way up for the other passes
+    self.upload  : RenderObject                = RenderObject(copy_frag_shader)
+    self.uploads : dict[str, moderngl.Texture] = {}
+
+  def add_pass(self, frag_shader:str, name:str=None, source:str=None, uniforms:dict=None, scale:float=1, dtype:str='f1') -> PostPass:
+    'adds a pass drawing frag_shader and returns it. surf is the output of source, the pass before it if none. string uniform values name the output of an earlier pass or an uploaded surface, scene being the window surface'
+    name = name if name != None else f'pass{len(self.passes)}'
+    if name == 'scene' or name in [post_pass.name for post_pass in self.passes]:
+      raise ValueError(f'post process already has an output named {name}')
+
+    render_obj = RenderObject(frag_shader, buffer=self.elements['MGL'].redundant_buffer)
+    post_pass = PostPass(name, render_obj, source, uniforms, scale, dtype)
+    self.passes.append(post_pass)
+    return post_pass
+
+  def add_pass_file(self, frag_path:str, name:str=None, source:str=None, uniforms:dict=None, scale:float=1, dtype:str='f1') -> PostPass:
+    'adds a pass drawing the fragment shader at frag_path and returns it'
+    return self.add_pass(read_file(frag_path), name, source, uniforms, scale, dtype)
+
+  def add_glow(self, source:str='glow', scale:float=0.5, intensity:float=1, blurs:int=1) -> None:
+    'blurs the uploaded surface source at scale and adds it over the output of the chain so far, the gpu side of glow drawn by the render singleton'
+    head = self.passes[-1].name if self.passes else 'scene'
+    prefix = f'{source}.glow{len(self.passes)}'
+    for i in range(blurs):
+      self.add_pass(blur_frag_shader, f'{prefix}.blur{i}.h', source=source, uniforms={'direction':(1.0, 0.0)}, scale=scale)
+      source = self.add_pass(blur_frag_shader, f'{prefix}.blur{i}.v', uniforms={'direction':(0.0, 1.0)}, scale=scale).name
+    self.add_pass(glow_frag_shader, source=head, uniforms={'glow':source, 'intensity':intensity})
+
+  def _get_texture(self, name:str, surf:pygame.Surface) -> moderngl.Texture:
+    'returns the texture surf is uploaded to, reused while its size stays the same'
+    texture = self.uploads.get(name, None)
+    if texture == None or texture.size != surf.get_size():
+      if texture != None:
+        texture.release()
+      texture = self.elements['MGL'].surf_to_tex(surf)
+      self.uploads[name] = texture
+    else:
+      texture.write(surf.get_view('1'))
+    return texture
+
+  def _upload(self, name:str, surf:pygame.Surface) -> RenderTarget:
+    'returns a pooled render target holding surf the same way up as pass outputs'
+    target = self.elements['MGL'].get_render_target(surf.get_size())
+    self.upload.render(target.frame_buf, {'surf':self._get_texture(name, surf)})
+    return target
+
+  def render(self, surf:pygame.Surface, dest:moderngl.Framebuffer=None, uniforms:dict=None) -> None:
+    'runs the chain over surf and draws the last pass to dest, the screen if none. surface uniforms are uploaded and can be named by passes, the rest go to every pass'
+    mgl = self.elements['MGL']
+    uniforms = {} if uniforms == None else uniforms.copy()
+    size = surf.get_size()
+
+    if self.passes == []:
+      self.upload.render(dest, {'surf':self._get_texture('scene', surf)})
+      return
+
+    outputs = {'scene':self._upload('scene', surf)}
+    for name, value in list(uniforms.items()):
+      if type(value) == pygame.Surface:
+        outputs[name] = self._upload(name, value)
+        del uniforms[name]
+
+    # every output goes back to the pool after the last pass reading it
+    last_read = {}
+    for i, post_pass in enumerate(self.passes):
+      sources = [post_pass.source if post_pass.source != None else (self.passes[i - 1].name if i > 0 else 'scene')]
+      sources += [value for value in post_pass.uniforms.values() if type(value) == str]
+      for source in sources:
+        last_read[source] = i
+
+    for name in list(outputs):
+      if name not in last_read:
+        mgl.release_render_target(outputs.pop(name))
+
+    for i, post_pass in enumerate(self.passes):
+      source = post_pass.source if post_pass.source != None else (self.passes[i - 1].name if i > 0 else 'scene')
+      pass_uniforms = {**uniforms, **post_pass.uniforms}
+      for key, value in pass_uniforms.items():
+        if type(value) == str:
+          pass_uniforms[key] = outputs[value].texture
+      pass_uniforms['surf'] = outputs[source].texture
+      pass_uniforms['texel'] = (1 / outputs[source].texture.width, 1 / outputs[source].texture.height)
+
+      if i == len(self.passes) - 1:
+        post_pass.render_obj.render(dest, pass_uniforms)
+      else:
+        target = mgl.get_render_target((max(int(size[0] * post_pass.scale), 1), max(int(size[1] * post_pass.scale), 1)), dtype=post_pass.dtype)
+        post_pass.render_obj.render(target.frame_buf, pass_uniforms)
+        outputs[post_pass.name] = target
+
+      for name in list(outputs):
+        if last_read.get(name, -1) <= i and name != post_pass.name:
+          mgl.release_render_target(outputs.pop(name))
+
+    for target in outputs.values():
+      mgl.release_render_target(target)
+
+  def release(self) -> None:
+    'frees the gpu memory of the uploaded surfaces'
+    for texture in self.uploads.values():
+      texture.release()
+    self.uploads.clear()
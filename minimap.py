@@ -0,0 +1,155 @@
+import pygame
+import math
+
+try:
+  from .elems import Element
+  from .world import World
+except:
+  from elems  import Element
+  from world  import World
+
+class Minimap(Element):
+  'downsampled overview of a world, kept per chunk at several mip levels and updated as chunks change'
+
+  def __init__(self, world:World, levels:int=6, tile_color:tuple=(120, 120, 120)):
+    super().__init__()
+    self.world      : World = world
+    self.levels     : int   = levels
+    self.tile_color : tuple = tile_color
+
+    hashmaps = world.get_hashmaps()
+    self.CHUNK_WIDTH : int = hashmaps['tile'].CHUNK_WIDTH
+    self.CHUNK_SIZE  : int = hashmaps['tile'].CHUNK_SIZE
+
+    # top layer first, the first layer with something at a cell gives the cell its color
+    self.sources : list = [hashmaps['texture.fg'], hashmaps['texture.mg'], hashmaps['texture.bg'], hashmaps['tile']]
+
+    # level k node (x, y) covers chunks (x << k, y << k) through ((x + 1) << k) - 1 at chunk_width pixels square
+    self.nodes    : list[dict] = [{} for _ in range(levels)]
+    self.dirty    : list[set]  = [set() for _ in range(levels)]
+    self.colors   : dict       = {}
+
+    # (level, node key, size) -> node scaled for drawing, only kept for the level and size last drawn at
+    self.scaled   : dict       = {}
+
+    # tags of chunks changed since the last update, every chunk already in the world to start with
+    self.changed  : set        = set()
+    for source in self.sources:
+      self.changed.update(source.chunks.keys())
+      source.add_listener(self._on_chunk_changed)
+
+  def _on_chunk_changed(self, chunk_tag:str) -> None:
+    'called by the sources when one of their chunks is edited, added or removed'
+    self.changed.add(chunk_tag)
+
+  def _get_color(self, data:tuple) -> tuple:
+    'returns the average color of a texture'
+    if data not in self.colors:
+      texture = self.elements['Sheets'].get_texture(*data)
+      self.colors[data] = pygame.transform.average_color(texture)[:3]
+    return self.colors[data]
+
+  def _build_chunk(self, chunk_tag:str) -> pygame.Surface:
+    'returns the level 0 image of a chunk, one pixel per tile, otherwise returns none if the chunk is empty'
+    chunks = [(source.peek_chunk(chunk_tag), source is self.sources[-1]) for source in self.sources if chunk_tag in source.chunks]
+    if chunks == []:
+      return None
+
+    surf = pygame.Surface((self.CHUNK_WIDTH, self.CHUNK_WIDTH))
+    surf.set_colorkey((0, 0, 0))
+
+    for row in range(self.CHUNK_WIDTH):
+      for col in range(self.CHUNK_WIDTH):
+        for chunk, is_tile in chunks:
+          data = chunk.grid[row][col]
+          if data == chunk.default:
+            continue
+
+          color = self.tile_color if is_tile else self._get_color(data)
+          surf.fill(color, (col, row, 1, 1))
+          break
+
+    return surf
+
+  def _build_node(self, level:int, key:tuple) -> pygame.Surface:
+    'returns the image of a node from its four children at the level below, otherwise returns none if they are all empty'
+    half = self.CHUNK_WIDTH // 2
+    surf = None
+    for offx in range(2):
+      for offy in range(2):
+        child = self.nodes[level - 1].get((key[0] * 2 + offx, key[1] * 2 + offy), None)
+        if child == None:
+          continue
+
+        if surf == None:
+          surf = pygame.Surface((self.CHUNK_WIDTH, self.CHUNK_WIDTH))
+          surf.set_colorkey((0, 0, 0))
+        surf.blit(pygame.transform.scale(child, (half, half)), (offx * half, offy * half))
+
+    return surf
+
+  def update(self) -> None:
+    'called every frame, rebuilds the images of chunks that changed since the last update and of the nodes above them'
+    changed, self.changed = self.changed, set()
+    rebuilt = set()
+
+    for chunk_tag in changed:
+      x, y = self.sources[-1]._unformat_chunk_tag(chunk_tag)
+      rebuilt.add((0, (x, y)))
+      surf = self._build_chunk(chunk_tag)
+      if surf == None:
+        self.nodes[0].pop((x, y), None)
+      else:
+        self.nodes[0][(x, y)] = surf
+
+      for level in range(1, self.levels):
+        self.dirty[level].add((x >> level, y >> level))
+
+    for level in range(1, self.levels):
+      for key in self.dirty[level]:
+        rebuilt.add((level, key))
+        surf = self._build_node(level, key)
+        if surf == None:
+          self.nodes[level].pop(key, None)
+        else:
+          self.nodes[level][key] = surf
+      self.dirty[level].clear()
+
+    if rebuilt != set():
+      self.scaled = {scaled_key:node for scaled_key, node in self.scaled.items() if scaled_key[:2] not in rebuilt}
+
+  def get_level(self, scale:float) -> int:
+    'returns the mip level closest to drawing the world at <scale> screen pixels per world pixel'
+    tile_size = self.CHUNK_SIZE / self.CHUNK_WIDTH
+    level = round(math.log2(max(1 / (scale * tile_size), 1e-9)))
+    return min(max(level, 0), self.levels - 1)
+
+  def render(self, surf:pygame.Surface, query:pygame.Rect, dest:pygame.Rect) -> None:
+    'draws the world region <query> scaled into <dest> on surf from the nearest mip level'
+    scale = dest.w / query.w
+    level = self.get_level(scale)
+    node_size = self.CHUNK_SIZE << level
+    node_dest_size = math.ceil(node_size * scale)
+
+    # nodes scaled for another level or size are not drawn again until the zoom comes back
+    if self.scaled != {} and next(iter(self.scaled))[::2] != (level, node_dest_size):
+      self.scaled.clear()
+
+    clip = surf.get_clip()
+    surf.set_clip(dest)
+
+    for x in range(query.left // node_size, query.right // node_size + 1):
+      for y in range(query.top // node_size, query.bottom // node_size + 1):
+        node = self.nodes[level].get((x, y), None)
+        if node == None:
+          continue
+
+        if node_dest_size != self.CHUNK_WIDTH:
+          scaled_key = (level, (x, y), node_dest_size)
+          if scaled_key not in self.scaled:
+            self.scaled[scaled_key] = pygame.transform.scale(node, (node_dest_size, node_dest_size))
+          node = self.scaled[scaled_key]
+
+        surf.blit(node, (dest.x + (x * node_size - query.x) * scale, dest.y + (y * node_size - query.y) * scale))
+
+    surf.set_clip(clip)
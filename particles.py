@@ -1,9 +1,9 @@
 import pygame
-import time
 import random
+import numbers
 
 from enum import IntEnum
-from typing import Generator
+from typing import Any, Generator
 
 try:
   from .elems import Element
@@ -59,7 +59,9 @@ class Emitter(Element):
       emit_delay:float=999999999,
       force:bool=False,
       params:dict=None,
-      param_flags:dict=None
+      param_flags:dict=None,
+      burst_size:int=1,
+      rate:float=0
     ):
 
     super().__init__()
@@ -67,26 +69,74 @@ class Emitter(Element):
     self.force       : bool           = force
     self.emitting    : bool           = False
     self.emit_delay  : float          = emit_delay
-    self.last_emit   : float          = 0
     self.source      : pygame.Vector2 = source if source else pygame.Vector2()
     self.params      : dict           = params if params else {}
     self.param_flags : dict           = param_flags if param_flags else {}
+    self.burst_size  : int            = burst_size
+
+    # particles per second, emitters with a rate emit continuously instead of in bursts every emit delay
+    self.rate        : float          = rate
+
+    # seconds since the last burst and fraction of a particle owed, advanced by dt so no clock is read
+    self.emit_timer  : float          = emit_delay
+    self.accumulator : float          = 0
+    self.last_source : pygame.Vector2 = self.source.copy()
+
+  def update(self, dt:float=None, view:pygame.Rect=None) -> None:
+    'called every frame with the frame time, emits every particle due over it. emitters outside view stay dormant and owe nothing when they come back'
+    if dt == None:
+      dt = self.elements['Window'].dt
+
+    if view != None and not view.collidepoint(self.source):
+      self.accumulator = 0
+      self.emit_timer = min(self.emit_timer + dt, self.emit_delay)
+
+    elif self.emitting and self.rate > 0:
+      self._emit_rate(dt)
+
+    # an emit delay of 0 or less bursts once every update
+    elif self.emitting and self.emit_delay <= 0:
+      self.emit_timer = 0
+      self.burst(self.burst_size)
+
+    elif self.emitting:
+      self.emit_timer += dt
+      if self.emit_timer >= self.emit_delay:
+        bursts = int(self.emit_timer // self.emit_delay)
+        self.emit_timer -= bursts * self.emit_delay
+        self.burst(self.burst_size * bursts)
+
+    self.last_source.update(self.source)
+
+  def _emit_rate(self, dt:float) -> None:
+    'emits the particles due at rate over the last dt seconds, spread along the path of the source with the ages they would have by now. only pools that simulate by dt use the ages, object particles start at their spread source'
+    owed = self.accumulator + self.rate * dt
+    due = int(owed)
+    self.accumulator = owed - due
+    count = self.pool.thin_emission(due)
+    if count == 0:
+      return
 
-  def update(self) -> None:
-    'called every frame and emits particles if possible'
-    if self.emitting and time.time() - self.last_emit >= self.emit_delay:
-      self.last_emit = time.time()
+    # particle i came due (i + 1 - old accumulator) / rate seconds into the frame, thinned emission keeps an even spread of them
+    start = 1 - (owed - self.rate * dt)
+    srcs, ages = self.pool.spread_emission(count, due, start, self.rate * dt, self.last_source, self.source, dt)
 
-      parameters = {}
-      for parameter in self.params:
-        if self.param_flags[parameter] == PARAMETER_TYPES.PASS:
-          parameters[parameter] = self.params[parameter]
-        elif self.param_flags[parameter] == PARAMETER_TYPES.RANDI:
-          parameters[parameter] = random.randint(*self.params[parameter])
-        elif self.param_flags[parameter] == PARAMETER_TYPES.RANDF:
-          parameters[parameter] = random.uniform(*self.params[parameter])
+    parameters = self.pool.sample_params(count, self.params, self.param_flags)
+    self.pool.create_particles(count, srcs, force=self.force, ages=ages, **parameters)
+
+  def burst(self, count:int) -> None:
+    'emits count particles at once, the parameters of all of them are sampled in one batch'
+    count = self.pool.thin_emission(count)
+    if count == 0:
+      return
 
-      self.pool.create_particle(self.source.xy, force=self.force, **parameters)
+    parameters = self.pool.sample_params(count, self.params, self.param_flags)
+    self.pool.create_particles(count, self.source.xy, force=self.force, **parameters)
+
+  def set_rate(self, rate:float) -> None:
+    'sets the number of particles emitted per second, 0 to emit in bursts every emit delay instead'
+    self.rate = rate
+    self.accumulator = 0
 
   def set_emit_source(self, x:int, y:int) -> None:
     'moves the emitter to emit from x, y'
@@ -131,6 +181,16 @@ class ParticlePool(Element):
 
     self.emitters : list = []
 
+    # culling against a camera, pools out of its padded view sleep or update every lod interval updates
+    self.camera       : Any   = None
+    self.cull_pad     : int   = 0
+    self.lod_interval : int   = 0
+    self.sleep_dt     : float = 0
+    self.sleep_frames : int   = 0
+
+    # alive particle count emission thins out towards, none for no limit
+    self.budget       : int   = None
+
   @property
   def alive_particles(self) -> Generator[Particle, None, None]:
     'generates all particles from the pool'
@@ -186,11 +246,29 @@ class ParticlePool(Element):
     self.pool[j] = p
 
   # creates a particle emitter
-  def create_emitter(self, emit_delay:float) -> Emitter:
-    'creates an emitter attached to this pool'
-    self.emitters.append(Emitter(self, emit_delay=emit_delay))
+  def create_emitter(self, emit_delay:float=999999999, burst_size:int=1, rate:float=0) -> Emitter:
+    'creates an emitter attached to this pool, emitting burst_size particles every emit_delay seconds or rate particles per second'
+    self.emitters.append(Emitter(self, emit_delay=emit_delay, burst_size=burst_size, rate=rate))
     return self.emitters[-1]
 
+  def sample_params(self, count:int, params:dict, flags:dict) -> dict:
+    'returns parameter -> list of count values, passed through or drawn at random as each parameter flag says'
+    samples = {}
+    for parameter, value in params.items():
+      if flags[parameter] == PARAMETER_TYPES.RANDI:
+        samples[parameter] = [random.randint(*value) for _ in range(count)]
+      elif flags[parameter] == PARAMETER_TYPES.RANDF:
+        samples[parameter] = [random.uniform(*value) for _ in range(count)]
+      else:
+        samples[parameter] = [value] * count
+    return samples
+
+  def spread_emission(self, count:int, due:int, start:float, span:float, src_from:pygame.Vector2, src_to:pygame.Vector2, dt:float) -> tuple[list, list]:
+    'returns the srcs and ages of count of due particles spread evenly between src_from and src_to, particle i coming due (start + i) / span of the way through the last dt seconds'
+    ts = [min((start + i // count) / span, 1) for i in range(0, due * count, due)]
+    srcs = [(src_from.x + (src_to.x - src_from.x) * t, src_from.y + (src_to.y - src_from.y) * t) for t in ts]
+    return srcs, [(1 - t) * dt for t in ts]
+
   def create_particle(self, src:tuple, force:bool=False, **kwargs) -> None:
     'creates a particle from the pool'
     p = self.get_next(force)
@@ -201,11 +279,85 @@ class ParticlePool(Element):
     p.set_pos(src[0], src[1])
     p.set_kwargs(**kwargs)
 
-  def update(self) -> None:
-    'called every frame to update the particle pool and attached emitters'
+  def create_particles(self, count:int, src:tuple, force:bool=False, ages:list[float]=None, **kwargs) -> None:
+    'creates count particles from the pool at src or a list of one src per particle, keyword arguments being lists of one value per particle. object particles step once per update and have no age, so ages is only used by pools that simulate by dt'
+    srcs = [src] * count if isinstance(src[0], numbers.Number) else src
+    for i in range(count):
+      p = self.get_next(force)
+      if p == None:
+        return
+
+      p.reset()
+      p.set_pos(srcs[i][0], srcs[i][1])
+      p.set_kwargs(**{name:values[i] for name, values in kwargs.items()})
+
+  def set_culling(self, camera:Any, pad:int=64, lod_interval:int=0) -> None:
+    'puts the pool to sleep while its emitters and particles are outside the camera rect grown by pad, updating it every lod_interval updates if not 0. none to turn off'
+    self.camera = camera
+    self.cull_pad = pad
+    self.lod_interval = lod_interval
+
+  def set_budget(self, budget:int=None) -> None:
+    'thins out emission as the alive particle count nears budget, none for no limit'
+    self.budget = budget
+
+  def thin_emission(self, count:int) -> int:
+    'returns how many of count particles to emit, fewer once over three quarters of the budget is alive and none at the budget'
+    if self.budget == None or self.particle_index < self.budget * 0.75:
+      return count
+
+    scale = max(self.budget - self.particle_index, 0) / (self.budget * 0.25)
+    return min(int(count * scale + random.random()), count)
+
+  def _get_view(self) -> pygame.Rect:
+    'returns the padded camera rect the pool is culled against, otherwise returns none'
+    if self.camera == None:
+      return None
+    return self.camera.rect.inflate(self.cull_pad * 2, self.cull_pad * 2)
+
+  def _get_bounds(self) -> pygame.Rect:
+    'returns the rect around every alive particle, otherwise returns none if none are alive'
+    if self.particle_index == 0:
+      return None
+
+    xs = [p.pos.x for p in self.alive_particles]
+    ys = [p.pos.y for p in self.alive_particles]
+    return pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+  def _get_step(self, dt:float, view:pygame.Rect) -> float:
+    'returns the time to simulate the particles by this update including any slept time, otherwise returns none while asleep'
+    bounds = self._get_bounds() if view != None else None
+    visible = view == None or any(view.collidepoint(emitter.source) for emitter in self.emitters if emitter.emitting) or (bounds != None and view.colliderect(bounds))
+
+    if visible:
+      dt += self.sleep_dt
+      self.sleep_dt = 0
+      self.sleep_frames = 0
+      return dt
+
+    self.sleep_dt += dt
+    self.sleep_frames += 1
+    if self.lod_interval > 0 and self.sleep_frames % self.lod_interval == 0:
+      dt, self.sleep_dt = self.sleep_dt, 0
+      return dt
+
+    return None
+
+  def update(self, dt:float=None) -> None:
+    'called every frame to update the particle pool and tick the attached emitters by dt, the window frame time by default'
+    if dt == None:
+      dt = self.elements['Window'].dt
+
+    view = self._get_view()
     for emitter in self.emitters:
-      emitter.update()
+      emitter.update(dt, view)
+
+    step = self._get_step(dt, view)
+    if step != None:
+      self._simulate(step)
 
+  def _simulate(self, dt:float) -> None:
+    'updates every alive particle once and removes the dead ones. object particles move a fixed step per update so slept time is not caught up, they simply pause'
     i = 0
     while i < self.particle_index:
       # otherwise, update particle
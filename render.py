@@ -1,13 +1,151 @@
 import pygame
+import threading
+
+from contextlib import contextmanager
+from typing     import Any
 
 try:
-  from .elems import Singleton
+  from .elems import Element, Singleton
 except:
-  from elems  import Singleton
+  from elems  import Element, Singleton
 
 DEFAULT : str = 'def'
 GLOW_Z : int = 63
 
+class RenderLayer(Element):
+  'retained blits that persist across frames until changed, optionally composited into one cached surface that is only rebuilt when dirty'
+
+  def __init__(self, z:int=0, cache_rect:pygame.Rect=None, parallax:float=1):
+    super().__init__()
+    self.z          : int         = z
+    self.cache_rect : pygame.Rect = cache_rect
+    self.parallax   : float       = parallax
+
+    # handle -> (surf, pos) or (surf, pos, area, flags) blit
+    self.items      : dict[int, tuple] = {}
+    self._next_id   : int              = 0
+    self.dirty      : bool             = True
+
+    self.cached     : pygame.Surface   = None
+    self._blits     : list             = []
+    self._offset    : tuple            = None
+
+    # area of the destination covered when last drawn
+    self.rect       : pygame.Rect      = None
+
+  def add(self, surf:pygame.Surface, pos:tuple, additive:bool=False) -> int:
+    'adds a surface to the layer at pos and returns its handle'
+    handle = self._next_id
+    self._next_id += 1
+    self.items[handle] = (surf, tuple(pos)) if not additive else (surf, tuple(pos), None, pygame.BLEND_RGBA_ADD)
+    self.dirty = True
+    return handle
+
+  def move(self, handle:int, pos:tuple) -> None:
+    'moves the surface of handle to pos'
+    self.items[handle] = (self.items[handle][0], tuple(pos), *self.items[handle][2:])
+    self.dirty = True
+
+  def remove(self, handle:int) -> None:
+    'removes the surface of handle from the layer'
+    self.items.pop(handle, None)
+    self.dirty = True
+
+  def clear(self) -> None:
+    'removes every surface from the layer'
+    self.items.clear()
+    self.dirty = True
+
+  def _is_additive(self, data:tuple) -> bool:
+    'returns boolean if an item is blended additively, those are left out of the cached surface since adding onto its transparent pixels would lose the blend'
+    return len(data) > 3 and data[3] == pygame.BLEND_RGBA_ADD
+
+  def _bake(self) -> None:
+    'composites every item that is not additive into the cached surface'
+    self.cached = pygame.Surface(self.cache_rect.size, pygame.SRCALPHA)
+    x, y = self.cache_rect.topleft
+    self.cached.blits([(data[0], (data[1][0] - x, data[1][1] - y), *data[2:]) for data in self.items.values() if not self._is_additive(data)], doreturn=False)
+
+  def get_rect(self, offset:tuple=(0, 0)) -> pygame.Rect:
+    'returns the area of the destination the layer covers when drawn with offset, otherwise returns none if it is empty'
+    ox, oy = offset[0] * self.parallax, offset[1] * self.parallax
+    if self.cache_rect != None:
+      return self.cache_rect.move(-ox, -oy)
+
+    rects = [pygame.Rect(data[1][0] - ox, data[1][1] - oy, *data[0].get_size()) for data in self.items.values()]
+    if rects == []:
+      return None
+    return rects[0].unionall(rects[1:])
+
+  def is_static(self, offset:tuple=(0, 0)) -> bool:
+    'returns boolean if drawing the layer with offset gives the same pixels as the last time it was drawn'
+    return not self.dirty and self._offset == (offset[0] * self.parallax, offset[1] * self.parallax)
+
+  def render(self, dest:pygame.Surface, offset:tuple=(0, 0), clips:list=None) -> int:
+    'draws the layer onto dest with offset scaled by parallax subtracted from positions, only inside clips if given, and returns the number of blits made'
+    ox, oy = offset[0] * self.parallax, offset[1] * self.parallax
+
+    if self.dirty or self._offset != (ox, oy):
+      if self.cache_rect != None and self.dirty:
+        self._bake()
+
+      # the blit sequence is reused while neither the items nor the offset change
+      # additive items are drawn over the cached surface every time
+      if self.cache_rect != None:
+        self._blits = [(self.cached, (self.cache_rect.x - ox, self.cache_rect.y - oy))]
+        self._blits += [(data[0], (data[1][0] - ox, data[1][1] - oy), *data[2:]) for data in self.items.values() if self._is_additive(data)]
+      else:
+        self._blits = [(data[0], (data[1][0] - ox, data[1][1] - oy), *data[2:]) for data in self.items.values()]
+      self.rect = self.get_rect(offset)
+      self._offset = (ox, oy)
+      self.dirty = False
+
+    if clips == None:
+      dest.blits(self._blits, doreturn=False)
+      return len(self._blits)
+
+    clip = dest.get_clip()
+    for rect in clips:
+      dest.set_clip(rect)
+      dest.blits(self._blits, doreturn=False)
+    dest.set_clip(clip)
+    return len(self._blits) * len(clips)
+
+class RenderBuffer:
+  'draws submitted by one thread since the last swap, the render singleton takes them all at the start of every render'
+
+  def __init__(self, groups:list):
+    self.lock   : threading.RLock  = threading.RLock()
+    self.thread : threading.Thread = threading.current_thread()
+    self.groups : list             = groups
+
+    # depth of the batch blocks the thread is inside, its draws are not taken while above 0
+    self.batching : int            = 0
+    self.reset()
+
+  def reset(self) -> None:
+    'empties the buffer'
+    # group -> z -> entries, laid out like the render groups of the render singleton
+    self.queue : dict[str, dict[int, list]] = {group:{} for group in self.groups}
+    self.funcs : set                        = set()
+    self.stats : dict[str, dict[str, int]]  = {group:{'submitted':0, 'culled':0} for group in self.groups}
+
+    # group -> world rect draws of the frame are culled against, read from the camera by this thread only
+    self.views : dict[str, pygame.Rect]     = {}
+
+  def get_bucket(self, z:int, group:str) -> list:
+    'returns the list of entries submitted at z in group'
+    buckets = self.queue[group]
+    if z not in buckets:
+      buckets[z] = []
+    return buckets[z]
+
+  def take(self) -> tuple[dict, set, dict]:
+    'returns the queue, function buckets and stats of the buffer and empties it, the lock must be held'
+    data = self.queue, self.funcs, self.stats
+    self.reset()
+    return data
+
 class Render(Singleton):
   'render singleton that is orders rendering'
 
@@ -15,48 +153,336 @@ class Render(Singleton):
     super().__init__()
 
     self.groups : list = groups if groups != None else [DEFAULT]
-    self.render_groups : dict = {}
+
+    # draws go into a buffer per submitting thread, swapped into the render groups by render so the next frame can be queued while this one is drawn
+    self._local   : threading.local    = threading.local()
+    self._buffers : list[RenderBuffer] = []
+    self._lock    : threading.Lock     = threading.Lock()
+
+    # group -> z -> entries to draw in submission order, (surf, pos) or (surf, pos, area, flags) blits and (func, args, kwargs, dirty) calls
+    self.render_groups : dict[str, dict[int, list]] = {}
     for group in self.groups:
-      self.render_groups[group] = []
+      self.render_groups[group] = {}
+
+    # (group, z) of the buckets holding function draws, every other bucket is drawn with a single blits call
+    self._func_buckets : set = set()
+
+    # group -> retained layers drawn every frame until removed
+    self.layers : dict[str, list[RenderLayer]] = {}
+
+    # group -> (camera, margin) of groups drawn in world space, their views are worked out once per frame by each drawing thread
+    self.cameras : dict[str, tuple[Any, int]] = {}
+
+    # group -> submitted, culled and drawn counts of the frame being drawn and of the last rendered frame
+    self.frame_stats : dict[str, dict[str, int]] = {}
+    self.stats       : dict[str, dict[str, int]] = {}
+    for group in self.groups:
+      self.frame_stats[group] = {'submitted':0, 'culled':0, 'drawn':0}
+
+    # destination -> background, threshold, rects drawn last frame and rects changed by the last render of destinations drawn with dirty rects
+    self.tracked  : dict[pygame.Surface, dict[str, Any]] = {}
+    self._removed : dict[str, list[pygame.Rect]]          = {}
+
+    # group -> surface its glow z is drawn on instead, cleared every render and composited by the gpu
+    self.glow_dests : dict[str, pygame.Surface] = {}
 
   # flushes out everything in the render pipe
   def flush(self) -> None:
-    'flushes all render calls out of the render queue'
+    'flushes all render calls out of the render queue, including those submitted by other threads'
+    with self._lock:
+      buffers = self._buffers.copy()
+    for buffer in buffers:
+      with buffer.lock:
+        buffer.reset()
+    self._flush_front()
+
+  def _flush_front(self) -> None:
+    'empties the swapped in queue after it is drawn'
     for group in self.groups:
-      self.render_groups[group] = []
+      self.render_groups[group] = {}
+      self.frame_stats[group] = {'submitted':0, 'culled':0, 'drawn':0}
+    self._func_buckets.clear()
+    self._removed.clear()
+
+  def add_layer(self, layer:RenderLayer, group:str=DEFAULT) -> RenderLayer:
+    'adds a retained layer drawn into group every frame at its z, before anything queued at the same z, and returns it'
+    self.layers.setdefault(group, []).append(layer)
+    return layer
+
+  def create_layer(self, z:int=0, group:str=DEFAULT, cache_rect:pygame.Rect=None, parallax:float=1) -> RenderLayer:
+    'creates, adds and returns a retained layer, composited into one cached surface over cache_rect if given'
+    return self.add_layer(RenderLayer(z, cache_rect, parallax), group)
+
+  def remove_layer(self, layer:RenderLayer, group:str=DEFAULT) -> None:
+    'stops drawing a retained layer'
+    if layer in self.layers.get(group, []):
+      self.layers[group].remove(layer)
+
+      # the area it covered has to be restored on tracked surfaces
+      if layer.rect != None:
+        self._removed.setdefault(group, []).append(layer.rect)
+
+  def track(self, surf:pygame.Surface, background:Any=(0, 0, 0), threshold:float=0.5) -> None:
+    'draws surf with dirty rects. instead of being cleared every frame, only the areas drawn this frame and last frame are restored to background, a color or surface, and redrawn. falls back to redrawing everything when they cover more than threshold of surf, or when a function draw is queued without a dirty rect'
+    self.tracked[surf] = {'background':background, 'threshold':threshold, 'last':None, 'dirty':None}
+
+  def untrack(self, surf:pygame.Surface) -> None:
+    'stops drawing surf with dirty rects'
+    self.tracked.pop(surf, None)
+
+  def mark_dirty(self, surf:pygame.Surface, rect:pygame.Rect) -> None:
+    'marks an area of a tracked surface drawn on after render this frame, so it is presented now and restored next frame'
+    track = self.tracked[surf]
+    for key in ('last', 'dirty'):
+      if track[key] != None:
+        track[key].append(pygame.Rect(rect))
+
+  def get_dirty(self, surf:pygame.Surface) -> list[pygame.Rect]:
+    'returns the areas of a tracked surface changed since the last call, otherwise returns none if all of it may have changed'
+    dirty = self.tracked[surf]['dirty']
+    self.tracked[surf]['dirty'] = []
+    return dirty
+
+  def set_glow_dest(self, group:str, surf:pygame.Surface) -> None:
+    'draws the glow z of group on surf instead of adding it onto the destination, for a post process glow pass to blur and add on the gpu. none to go back'
+    if surf == None:
+      self.glow_dests.pop(group, None)
+    else:
+      self.glow_dests[group] = surf
+
+  def set_camera(self, group:str, camera:Any, margin:int=0) -> None:
+    'makes group take world space positions, culling surfaces outside the camera rect grown by margin as they are queued and offsetting the rest when rendered. none to go back to screen space'
+    if camera == None:
+      self.cameras.pop(group, None)
+    else:
+      self.cameras[group] = (camera, margin)
+
+    with self._lock:
+      buffers = self._buffers.copy()
+    for buffer in buffers:
+      with buffer.lock:
+        buffer.views.pop(group, None)
+
+  def get_offset(self, group:str=DEFAULT) -> tuple[int, int]:
+    'returns the world position drawn at the top left of group, for function draws to apply themselves'
+    if group not in self.cameras:
+      return 0, 0
+    return self.cameras[group][0].rect.topleft
+
+  def _get_view(self, buffer:RenderBuffer, group:str) -> pygame.Rect:
+    'returns the world rect surfaces queued in group this frame are culled against, read from the camera the first time the thread of buffer draws in group each frame. the buffer lock must be held'
+    if group not in buffer.views:
+      camera, margin = self.cameras[group]
+      buffer.views[group] = camera.rect.inflate(margin * 2, margin * 2)
+    return buffer.views[group]
+
+  def _get_buffer(self) -> RenderBuffer:
+    'returns the submission buffer of the calling thread'
+    buffer = getattr(self._local, 'buffer', None)
+    if buffer == None:
+      buffer = RenderBuffer(self.groups)
+      with self._lock:
+        self._buffers.append(buffer)
+      self._local.buffer = buffer
+    return buffer
+
+  @contextmanager
+  def batch(self):
+    'holds the draws the calling thread submits inside the block back from render until the block ends, so they are never split across two frames. a render that swaps meanwhile leaves them for the next frame instead of waiting'
+    buffer = self._get_buffer()
+    with buffer.lock:
+      buffer.batching += 1
+    try:
+      yield
+    finally:
+      with buffer.lock:
+        buffer.batching -= 1
+
+  def swap(self) -> None:
+    'moves the draws every thread submitted since the last swap into the render groups, in the order the threads first drew, and starts the next frame. threads inside a batch are left for the next swap. called by render'
+    with self._lock:
+      buffers = self._buffers.copy()
+
+    for buffer in buffers:
+      with buffer.lock:
+        # a thread in the middle of a batch keeps its draws for the next frame rather than stalling this one
+        if buffer.batching > 0:
+          continue
+        queue, funcs, stats = buffer.take()
+
+      for group, buckets in queue.items():
+        front = self.render_groups[group]
+        for z, bucket in buckets.items():
+          if z in front:
+            front[z].extend(bucket)
+          else:
+            front[z] = bucket
+
+        for key, count in stats[group].items():
+          self.frame_stats[group][key] += count
+      self._func_buckets |= funcs
+
+      # buffers of finished threads are dropped once drained
+      if not buffer.thread.is_alive():
+        with self._lock:
+          self._buffers.remove(buffer)
 
   # takes a surface and adds it to the rendering queue
   def draw(self, surf:pygame.Surface, pos:tuple, z:int=0, group:str=DEFAULT) -> None:
-    'queues a simple blit call for surface rendering'
-    self.render_groups[group].append((z, surf, pos))
+    'queues a simple blit call for surface rendering, at a world position in groups with a camera. safe to call from any thread'
+    buffer = self._get_buffer()
+    with buffer.lock:
+      stats = buffer.stats[group]
+      stats['submitted'] += 1
+
+      if group in self.cameras:
+        view = self._get_view(buffer, group)
+        w, h = surf.get_size()
+        if pos[0] >= view.right or pos[1] >= view.bottom or pos[0] + w <= view.left or pos[1] + h <= view.top:
+          stats['culled'] += 1
+          return
+
+      if z != GLOW_Z:
+        buffer.get_bucket(z, group).append((surf, pos))
+      else:
+        buffer.get_bucket(z, group).append((surf, pos, None, pygame.BLEND_RGBA_ADD))
 
   # takes a render func with its args and kwargs and adds it to the rendering queue
   def drawf(self, func:callable, *args, **kwargs) -> None:
-    'queues a function reference draw'
+    'queues a function reference draw, performed on the rendering thread. on tracked surfaces, dirty is the screen rect it draws in. the area drawn by a function is unknown without it, so the whole surface is restored and redrawn that frame. safe to call from any thread'
     z = kwargs['z'] if 'z' in kwargs else 0
     group = kwargs['group'] if 'group' in kwargs else DEFAULT
+    dirty = kwargs['dirty'] if 'dirty' in kwargs else None
     if 'z' in kwargs: del kwargs['z']
     if 'group' in kwargs: del kwargs['group']
+    if 'dirty' in kwargs: del kwargs['dirty']
+
+    buffer = self._get_buffer()
+    with buffer.lock:
+      buffer.get_bucket(z, group).append((func, args, kwargs, dirty))
+      buffer.funcs.add((group, z))
+      buffer.stats[group]['submitted'] += 1
+
+  def _render_bucket(self, dest:pygame.Surface, bucket:list) -> None:
+    'performs the entries of a bucket holding function draws in order, runs of blits between them in single blits calls'
+    run = []
+    for data in bucket:
+      if callable(data[0]):
+        if run:
+          dest.blits(run, doreturn=False)
+          run = []
+        func, args, kwargs, _ = data
+        func(dest, *args, **kwargs)
+      else:
+        run.append(data)
 
-    self.render_groups[group].append((z, func, args, kwargs))
+    if run:
+      dest.blits(run, doreturn=False)
+
+  def _get_queued_rects(self, group:str) -> list[pygame.Rect]:
+    'returns the screen rects of everything queued in group and of its layers that changed, otherwise returns none if a function draw did not give one'
+    rects = self._removed.get(group, []).copy()
+    ox, oy = self.get_offset(group)
+    for bucket in self.render_groups[group].values():
+      for data in bucket:
+        if callable(data[0]):
+          if data[3] == None:
+            return None
+          rects.append(pygame.Rect(data[3]))
+        else:
+          w, h = data[0].get_size() if len(data) == 2 or data[2] == None else pygame.Rect(data[2]).size
+          rects.append(pygame.Rect(data[1][0] - ox, data[1][1] - oy, w, h))
+
+    for layer in self.layers.get(group, []):
+      if not layer.is_static((ox, oy)):
+        rects.extend(rect for rect in (layer.rect, layer.get_rect((ox, oy))) if rect != None)
+
+    return rects
+
+  def _restore(self, surf:pygame.Surface, groups:list) -> list[pygame.Rect]:
+    'restores the background of a tracked surface where it is drawn this frame or was drawn last frame and returns those rects, otherwise returns none after restoring all of it'
+    track = self.tracked[surf]
+    bounds = surf.get_rect()
+
+    rects = []
+    for group in groups:
+      queued = self._get_queued_rects(group)
+      if queued == None:
+        rects = None
+        break
+      rects.extend(queued)
+
+    region = None
+    if rects != None and track['last'] != None:
+      region = [rect.clip(bounds) for rect in track['last'] + rects]
+      region = [rect for rect in region if rect.w > 0 and rect.h > 0]
+
+      # many small rects are restored as one, every rect costs a pass over the unchanged layers
+      if len(region) > 16:
+        region = [region[0].unionall(region[1:])]
+
+      if sum(rect.w * rect.h for rect in region) > track['threshold'] * bounds.w * bounds.h:
+        region = None
+
+    track['last'] = rects
+    track['dirty'] = region
+
+    for rect in (region if region != None else [bounds]):
+      if isinstance(track['background'], pygame.Surface):
+        surf.blit(track['background'], rect, rect)
+      else:
+        surf.fill(track['background'], rect)
+
+    return region
 
   # renders to the destination surfaces, does it in place
   def render(self, dests:dict) -> None:
-    'performs all queued render calls and flushes the render queue'
+    'swaps in the draws submitted since the last render, performs them and the retained layers in z order, and in submission order within a z, then flushes them'
+    self.swap()
+
+    # tracked surfaces are restored before anything is drawn on them, unchanged layers are then only redrawn inside the restored rects
+    regions = {}
+    for surf in set(dests.values()):
+      if surf in self.tracked:
+        regions[surf] = self._restore(surf, [group for group in dests if dests[group] is surf and group in self.render_groups])
+
     for group in dests:
       if group not in self.render_groups:
         continue
 
-      self.render_groups[group].sort(key=lambda data : data[0])
+      buckets = self.render_groups[group]
+      layers = self.layers.get(group, [])
+      region = regions.get(dests[group], None)
+      ox, oy = self.get_offset(group)
+
+      if group in self.glow_dests:
+        self.glow_dests[group].fill((0, 0, 0, 0))
+
+      for z in sorted(set(buckets).union(layer.z for layer in layers)):
+        dest = dests[group]
+        if z == GLOW_Z and group in self.glow_dests:
+          dest = self.glow_dests[group]
 
-      for data in self.render_groups[group]:
-        if len(data) > 3:
-          _, func, args, kwargs = data
-          func(dests[group], *args, **kwargs)
+        for layer in layers:
+          if layer.z == z:
+            clips = region if region != None and dest is dests[group] and layer.is_static((ox, oy)) else None
+            self.frame_stats[group]['drawn'] += layer.render(dest, (ox, oy), clips)
+
+        if z not in buckets:
+          continue
+
+        bucket = buckets[z]
+        self.frame_stats[group]['drawn'] += len(bucket)
+
+        # world space groups are moved to screen space in one pass per bucket
+        if group in self.cameras:
+          bucket = [data if callable(data[0]) else (data[0], (data[1][0] - ox, data[1][1] - oy), *data[2:]) for data in bucket]
+
+        if (group, z) in self._func_buckets:
+          self._render_bucket(dest, bucket)
         else:
-          if data[0] != GLOW_Z:
-            dests[group].blit(data[1], data[2])
-          else:
-            dests[group].blit(data[1], data[2], special_flags=pygame.BLEND_RGBA_ADD)
+          dest.blits(bucket, doreturn=False)
 
-    self.flush()
\ No newline at end of file
+    self.stats = self.frame_stats
+    self.frame_stats = {}
+    self._flush_front()
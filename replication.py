@@ -0,0 +1,416 @@
+import pygame
+import struct
+import socket
+import time
+import zlib
+
+from collections import deque
+from typing import Any
+
+try:
+  from .elems       import Element
+  from .spatialhash import SpatialHashMap
+  from .decormap    import DecorSHMap
+  from .utils       import point2d
+except:
+  from elems        import Element
+  from spatialhash  import SpatialHashMap
+  from decormap     import DecorSHMap
+  from utils        import point2d
+
+# message layout, all little endian:
+#   header          magic 'DR', flags u8 (bit 0: body is zlib compressed)
+#   body            map count u16, then per map:
+#     map           name length u8, name, kind u8
+#     decor map     decor string length u32, decor string
+#     grid map      palette flags u8 (bit 0: palette reset), new palette entry count u16, palette values, chunk count u32, chunks
+#     chunk         chunk x i32, chunk y i32, op u8, chunk version u32, cell count u16, cells
+#     cell          cell index u16, palette id u16
+#   palette value   type u8 (0 none, 1 int, 2 tuple), int i32 or tuple length u8 and ints i32
+MAGIC      : bytes = b'DR'
+COMPRESSED : int   = 1
+
+KIND_GRID  : int = 0
+KIND_DECOR : int = 1
+
+OP_CELLS   : int = 0
+OP_RESET   : int = 1
+OP_REMOVE  : int = 2
+
+PALETTE_RESET : int = 1
+
+# palette ids are u16, a peer's palette is started over once it passes half of them so a delta can always add the other half
+PALETTE_SIZE  : int = 65536
+
+HEADER  : struct.Struct = struct.Struct('<2sB')
+CHUNK   : struct.Struct = struct.Struct('<iiBIH')
+CELL    : struct.Struct = struct.Struct('<HH')
+FRAME   : struct.Struct = struct.Struct('<I')
+
+def _pack_value(value:Any) -> bytes:
+  'returns the binary form of a chunk cell value'
+  if value == None:
+    return b'\x00'
+  if isinstance(value, int):
+    return struct.pack('<Bi', 1, value)
+  return struct.pack(f'<BB{len(value)}i', 2, len(value), *value)
+
+def _unpack_value(data:bytes, offset:int) -> tuple[Any, int]:
+  'returns a chunk cell value read from data at offset and the offset after it'
+  kind = data[offset]
+  if kind == 0:
+    return None, offset + 1
+  if kind == 1:
+    return struct.unpack_from('<i', data, offset + 1)[0], offset + 5
+  length = data[offset + 1]
+  return tuple(struct.unpack_from(f'<{length}i', data, offset + 2)), offset + 2 + 4 * length
+
+class ReplicationStats(Element):
+  'counts the bytes and messages sent by a replicator'
+
+  def __init__(self):
+    super().__init__()
+    self.start    : float = time.perf_counter()
+    self.bytes    : int   = 0
+    self.messages : int   = 0
+    self.chunks   : int   = 0
+    self.cells    : int   = 0
+
+  def bytes_per_second(self) -> float:
+    'returns the average bytes sent per second since the stats were created or reset'
+    return self.bytes / max(time.perf_counter() - self.start, 1e-9)
+
+  def reset(self) -> None:
+    'restarts counting'
+    self.__init__()
+
+class ReplicationPeer(Element):
+  'state of what one remote world has been sent, the chunks it holds as snapshots and the palette values it knows'
+
+  def __init__(self, interest:pygame.Rect=None):
+    super().__init__()
+    self.interest  : pygame.Rect = interest
+    self.baselines : dict        = {}
+    self.palettes  : dict        = {}
+    self.decor     : dict        = {}
+    self.stats     : ReplicationStats = ReplicationStats()
+
+class Replicator(Element):
+  'produces binary deltas of spatial hashes for remote replicas, only sending chunks inside each peer\'s interest rect'
+
+  def __init__(self, hashmaps:dict[str, SpatialHashMap], compress:bool=True):
+    super().__init__()
+    self.hashmaps : dict = hashmaps
+    self.compress : bool = compress
+    self.peers    : list[ReplicationPeer] = []
+
+  def add_peer(self, interest:pygame.Rect=None) -> ReplicationPeer:
+    'returns the state of a new peer that has not been sent anything, interest of none sends every chunk'
+    self.peers.append(ReplicationPeer(interest))
+    return self.peers[-1]
+
+  def remove_peer(self, peer:ReplicationPeer) -> None:
+    'stops tracking a peer'
+    self.peers.remove(peer)
+
+  def _get_tags(self, hashmap:SpatialHashMap, peer:ReplicationPeer, name:str) -> tuple[list[str], set[str]]:
+    'returns the tags of every chunk the peer may need, existing or removed, and of every chunk it holds, along with the set of those inside its interest rect, none without one'
+    if peer.interest != None:
+      inside = hashmap.get_chunks_in_rect(peer.interest, include_empty=True)
+      tags = dict.fromkeys(inside)
+      inside = set(inside)
+    else:
+      tags = dict.fromkeys(hashmap.chunks)
+      inside = None
+
+    tags.update(dict.fromkeys(tag for (baseline_name, tag) in peer.baselines if baseline_name == name))
+    return list(tags), inside
+
+  def _encode_cells(self, cells:list, palette:dict, new_values:list) -> bytes:
+    'returns the binary form of (index, value) cells, adding unseen values to the palette'
+    data = bytearray()
+    for index, value in cells:
+      if value not in palette:
+        # palettes start a delta under half full, so this keeps both the ids and the u16 count of new values in range
+        if len(new_values) >= PALETTE_SIZE // 2:
+          raise ValueError(f'a delta can not add more than {PALETTE_SIZE // 2} distinct values to a palette')
+        palette[value] = len(palette)
+        new_values.append(value)
+      data += CELL.pack(index, palette[value])
+    return bytes(data)
+
+  def _encode_grid(self, name:str, hashmap:SpatialHashMap, peer:ReplicationPeer) -> bytes:
+    'returns the binary record of every changed chunk of a grid based spatial hash'
+    palette = peer.palettes.setdefault(name, {})
+    flags = 0
+    if len(palette) >= PALETTE_SIZE // 2:
+      palette.clear()
+      flags |= PALETTE_RESET
+
+    new_values = []
+    chunk_data = bytearray()
+    chunk_count = 0
+
+    tags, inside = self._get_tags(hashmap, peer, name)
+    for chunk_tag in tags:
+      version = hashmap.get_chunk_version(chunk_tag)
+      baseline = peer.baselines.get((name, chunk_tag), None)
+      chunkx, chunky = hashmap._unformat_chunk_tag(chunk_tag)
+
+      # chunks that left the interest rect are removed from the peer as if deleted
+      if version == None or (inside != None and chunk_tag not in inside):
+        if baseline != None:
+          del peer.baselines[(name, chunk_tag)]
+          chunk_data += CHUNK.pack(chunkx, chunky, OP_REMOVE, 0, 0)
+          chunk_count += 1
+        continue
+
+      if baseline != None and baseline.version == version:
+        continue
+
+      # cold chunks are read without rebuilding them into the hash
+      chunk = hashmap.peek_chunk(chunk_tag)
+
+      width = chunk.chunk_width
+      cells = []
+      if baseline == None:
+        op = OP_RESET
+        for row in range(width):
+          for col, value in enumerate(chunk.grid[row]):
+            if value != chunk.default:
+              cells.append((row * width + col, value))
+      else:
+        op = OP_CELLS
+        for row in range(width):
+          live_row, base_row = chunk.grid[row], baseline.grid[row]
+          if live_row is base_row or live_row == base_row:
+            continue
+          for col in range(width):
+            if live_row[col] != base_row[col]:
+              cells.append((row * width + col, live_row[col]))
+
+      chunk_data += CHUNK.pack(chunkx, chunky, op, chunk.version & 0xffffffff, len(cells))
+      chunk_data += self._encode_cells(cells, palette, new_values)
+      peer.baselines[(name, chunk_tag)] = chunk.snapshot()
+      peer.stats.cells += len(cells)
+      chunk_count += 1
+
+    if chunk_count == 0 and flags == 0:
+      return b''
+
+    peer.stats.chunks += chunk_count
+    record = bytearray(struct.pack('<BH', flags, len(new_values)))
+    for value in new_values:
+      record += _pack_value(value)
+    record += struct.pack('<I', chunk_count)
+    return bytes(record + chunk_data)
+
+  def _encode_decor(self, name:str, hashmap:DecorSHMap, peer:ReplicationPeer) -> bytes:
+    'returns the binary record of a decor spatial hash if it changed, decor is sent whole and ignores the interest rect'
+    if peer.decor.get(name, None) == hashmap.version:
+      return b''
+
+    peer.decor[name] = hashmap.version
+    decor = hashmap.get_save_data()['decor'].encode()
+    return struct.pack('<I', len(decor)) + decor
+
+  def encode_delta(self, peer:ReplicationPeer) -> bytes:
+    'returns a message with every change the peer has not been sent yet and marks them as sent'
+    body = bytearray()
+    map_count = 0
+    for name, hashmap in self.hashmaps.items():
+      if isinstance(hashmap, DecorSHMap):
+        kind, record = KIND_DECOR, self._encode_decor(name, hashmap, peer)
+      else:
+        kind, record = KIND_GRID, self._encode_grid(name, hashmap, peer)
+
+      if record == b'':
+        continue
+
+      encoded_name = name.encode()
+      body += struct.pack('<B', len(encoded_name)) + encoded_name + struct.pack('<B', kind) + record
+      map_count += 1
+
+    body = struct.pack('<H', map_count) + body
+    flags = 0
+    if self.compress:
+      body = zlib.compress(body)
+      flags |= COMPRESSED
+
+    message = HEADER.pack(MAGIC, flags) + body
+    peer.stats.bytes += len(message)
+    peer.stats.messages += 1
+    return message
+
+class Replica(Element):
+  'applies messages from a replicator to local spatial hashes'
+
+  def __init__(self, hashmaps:dict[str, SpatialHashMap]):
+    super().__init__()
+    self.hashmaps : dict = hashmaps
+    self.palettes : dict = {}
+
+  def _apply_chunk(self, hashmap:SpatialHashMap, chunk_tag:str, op:int, cells:list, palette:list) -> None:
+    'applies one chunk record to a spatial hash'
+    if op == OP_REMOVE or op == OP_RESET:
+      hashmap.chunks.pop(chunk_tag, None)
+      hashmap.mark_changed(chunk_tag)
+      if op == OP_REMOVE:
+        return
+
+    if chunk_tag not in hashmap.chunks:
+      chunk_pos = point2d(*hashmap._unformat_chunk_tag(chunk_tag))
+      hashmap.chunks[chunk_tag] = hashmap._create_chunk(chunk_pos, hashmap.CHUNK_WIDTH, hashmap.TILE_SIZE)
+
+    chunk = hashmap.chunks[chunk_tag]
+    for index, palette_id in cells:
+      row, col = divmod(index, chunk.chunk_width)
+      value = palette[palette_id]
+      if value == chunk.default:
+        chunk.del_item(row, col)
+      else:
+        chunk.add_item(row, col, value)
+
+    if chunk.count == 0:
+      del hashmap.chunks[chunk_tag]
+
+  def apply_delta(self, message:bytes) -> None:
+    'applies a message produced by Replicator.encode_delta'
+    magic, flags = HEADER.unpack_from(message, 0)
+    if magic != MAGIC:
+      raise ValueError('not a replication message')
+
+    body = message[HEADER.size:]
+    if flags & COMPRESSED:
+      body = zlib.decompress(body)
+
+    map_count, = struct.unpack_from('<H', body, 0)
+    offset = 2
+    for _ in range(map_count):
+      name_length = body[offset]
+      name = body[offset + 1:offset + 1 + name_length].decode()
+      kind = body[offset + 1 + name_length]
+      offset += 2 + name_length
+      hashmap = self.hashmaps[name]
+
+      if kind == KIND_DECOR:
+        decor_length, = struct.unpack_from('<I', body, offset)
+        decor = body[offset + 4:offset + 4 + decor_length].decode()
+        offset += 4 + decor_length
+        hashmap.load_from_data({'width':hashmap.CHUNK_WIDTH, 'size':hashmap.TILE_SIZE, 'decor':decor})
+        continue
+
+      palette = self.palettes.setdefault(name, [])
+      flags, value_count = struct.unpack_from('<BH', body, offset)
+      offset += 3
+      if flags & PALETTE_RESET:
+        palette.clear()
+      for _ in range(value_count):
+        value, offset = _unpack_value(body, offset)
+        palette.append(value)
+
+      chunk_count, = struct.unpack_from('<I', body, offset)
+      offset += 4
+      for _ in range(chunk_count):
+        chunkx, chunky, op, _, cell_count = CHUNK.unpack_from(body, offset)
+        offset += CHUNK.size
+        cells = [CELL.unpack_from(body, offset + i * CELL.size) for i in range(cell_count)]
+        offset += cell_count * CELL.size
+        self._apply_chunk(hashmap, hashmap._format_chunk_tag(chunkx, chunky), op, cells, palette)
+
+class MemoryTransport(Element):
+  'in-memory message transport, messages sent are received in order'
+
+  def __init__(self):
+    super().__init__()
+    self.messages : deque = deque()
+
+  def send(self, message:bytes) -> None:
+    'queues a message'
+    self.messages.append(message)
+
+  def receive(self) -> list[bytes]:
+    'returns every message sent since the last receive'
+    messages = list(self.messages)
+    self.messages.clear()
+    return messages
+
+class SocketTransport(Element):
+  'message transport over a connected stream socket, each message is prefixed with its length'
+
+  def __init__(self, sock:socket.socket):
+    super().__init__()
+    self.sock   : socket.socket = sock
+    self.buffer : bytearray     = bytearray()
+    self.sock.setblocking(False)
+
+  def send(self, message:bytes) -> None:
+    'sends a message, blocking until the socket accepts all of it'
+    self.sock.setblocking(True)
+    self.sock.sendall(FRAME.pack(len(message)) + message)
+    self.sock.setblocking(False)
+
+  def receive(self) -> list[bytes]:
+    'returns every complete message received so far without blocking'
+    while True:
+      try:
+        data = self.sock.recv(65536)
+      except BlockingIOError:
+        break
+      if not data:
+        break
+      self.buffer += data
+
+    messages = []
+    while len(self.buffer) >= FRAME.size:
+      length, = FRAME.unpack_from(self.buffer, 0)
+      if len(self.buffer) < FRAME.size + length:
+        break
+      messages.append(bytes(self.buffer[FRAME.size:FRAME.size + length]))
+      del self.buffer[:FRAME.size + length]
+    return messages
+
+if __name__ == '__main__':
+  import random
+
+  try:
+    from .tilemap import TileSHMap
+    from .texmap  import TexSHMap
+  except:
+    from tilemap  import TileSHMap
+    from texmap   import TexSHMap
+
+  # scripted edit load: a few hundred tile and texture edits per frame around a moving camera
+  def run(name:str, send_transport:Any, receive_transport:Any, frames:int=300, edits:int=200) -> None:
+    source = {'tile':TileSHMap(), 'texture':TexSHMap()}
+    target = {'tile':TileSHMap(), 'texture':TexSHMap()}
+    replicator = Replicator(source)
+    replica = Replica(target)
+    peer = replicator.add_peer(pygame.Rect(0, 0, 1280, 720))
+
+    for frame in range(frames):
+      peer.interest.x = frame * 4
+      for _ in range(edits):
+        x = random.uniform(peer.interest.left, peer.interest.right)
+        y = random.uniform(peer.interest.top, peer.interest.bottom)
+        source['tile'].add_tile(x, y)
+        source['texture'].add_tile(x, y, random.randint(0, 3), random.randint(0, 15), random.randint(0, 3))
+
+      send_transport.send(replicator.encode_delta(peer))
+      for message in receive_transport.receive():
+        replica.apply_delta(message)
+
+    for message in receive_transport.receive():
+      replica.apply_delta(message)
+
+    synced = all(
+      source[key].chunks[tag].grid == target[key].chunks[tag].grid
+      for key in source for tag in source[key].get_chunks_in_rect(peer.interest)
+    )
+    print(f'{name}: {peer.stats.bytes} bytes in {peer.stats.messages} messages, {peer.stats.bytes / frames * 60 / 1024:.1f} KiB/s at 60 fps, synced: {synced}')
+
+  memory = MemoryTransport()
+  run('memory', memory, memory)
+
+  server, client = socket.socketpair()
+  run('socket', SocketTransport(server), SocketTransport(client))
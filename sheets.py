@@ -3,6 +3,7 @@ import json
 import pprint
 import os
 import random
+import hashlib
 
 try:
   from .elems import Singleton
@@ -20,6 +21,8 @@ class Sheets(Singleton):
 
     self.sheets : dict = {}
     self.configs : dict = {}
+    self.animations : dict = {}
+    self.hashes : dict = {}
     self.sheet_map : list = []
 
   def load_sheet(self, path:str, cfg:bool=True) -> None:
@@ -28,6 +31,9 @@ class Sheets(Singleton):
 
     raw_sheet = pygame.image.load(path)
 
+    with open(path, 'rb') as f:
+      sheet_hash = hashlib.sha1(f.read())
+
     self.sheets[name] = {'surf':raw_sheet, 'dat':[]}
     self.sheet_map.append(name)
 
@@ -64,6 +70,8 @@ class Sheets(Singleton):
         with open(cfg_path, 'r') as f:
           cfg_data = json.load(f)
 
+        sheet_hash.update(json.dumps(cfg_data, sort_keys=True).encode())
+
         self.configs[name] = cfg_data
 
       else:
@@ -71,7 +79,8 @@ class Sheets(Singleton):
         self.configs[name] = {
           'bits':4,
           'offsets':[],
-          'weights':[]
+          'weights':[],
+          'anims':{}
         }
 
         for row in range(len(self.sheets[name]['dat'])):
@@ -81,10 +90,30 @@ class Sheets(Singleton):
             self.configs[name]['offsets'][row].append((0, 0))
             self.configs[name]['weights'][row].append(1)
 
+      self._load_animations(name)
+
+    self.hashes[name] = sheet_hash.hexdigest()
+
+  def _load_animations(self, name:str) -> None:
+    'parses the animated textures of a sheet config, keyed "row,col" with lists of frames as [row, col] and durations in seconds'
+    self.animations[name] = {}
+    for key, anim in self.configs[name].get('anims', {}).items():
+      row, col = [int(value) for value in key.split(',')]
+      frames = [tuple(frame) for frame in anim['frames']]
+      durations = anim['durations']
+      self.animations[name][(row, col)] = (frames, durations, sum(durations))
+
   def load_sheets(self, path_data:list[tuple[str, bool]]) -> None:
     for path, cfg in path_data:
       self.load_sheet(path, cfg)
 
+  def get_sheets_hash(self) -> str:
+    'returns a hash of every loaded sheet image and config, changes whenever any loaded sheet file changes'
+    sheets_hash = hashlib.sha1()
+    for name in self.sheet_map:
+      sheets_hash.update(self.hashes[name].encode())
+    return sheets_hash.hexdigest()
+
   def get_sheet_names(self) -> list:
     return self.sheet_map.copy()
   
@@ -103,6 +132,26 @@ class Sheets(Singleton):
 
     return sheet_data['dat'][row][col]
   
+  def is_animated(self, sheet_id:int, row:int, col:int) -> bool:
+    'returns boolean if the texture at row, col is animated'
+    sheet_name = self.sheet_map[sheet_id]
+    return (row, col) in self.animations.get(sheet_name, {})
+
+  def get_animation_frame(self, sheet_id:int, row:int, col:int, t:float) -> tuple[int, int]:
+    'returns the row, col of the frame an animated texture shows at time t'
+    sheet_name = self.sheet_map[sheet_id]
+    frames, durations, total = self.animations[sheet_name][(row, col)]
+
+    if total <= 0:
+      return frames[0]
+
+    t %= total
+    for frame, duration in zip(frames, durations):
+      if t < duration:
+        return frame
+      t -= duration
+    return frames[-1]
+
   def get_texture_offsets(self, sheet_id:int, row:int, col:int) -> tuple[int, int]:
     sheet_name = self.sheet_map[sheet_id]
     sheet_cnfg = self.configs[sheet_name]
@@ -189,7 +238,8 @@ class Sheets(Singleton):
       config = {
         'bits':4,
         'offsets':[],
-        'weights':[]
+        'weights':[],
+        'anims':{}
       }
 
       for row in range(len(rects)):
@@ -2,16 +2,41 @@ import pygame
 import pickle
 import gzip
 import zlib
+import itertools
+import bisect
+import time
+import copy
+import types
+import weakref
 
 from typing import Any
 
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
 try:
   from .elems import Element
-  from .utils import point2d, reshape
+  from .utils import point2d, reshape, paused_gc
 except:
   from elems import Element
-  from utils import point2d, reshape
+  from utils import point2d, reshape, paused_gc
+
+# shared by every chunk so a version is never reused, even across deleted and recreated chunks
+_chunk_versions = itertools.count(1)
+
+class SharedGrid(list):
+  'chunk grid interned by a spatial hash, never edited in place. it leaves the intern table once no chunk uses it'
 
+  __slots__ = ('__weakref__', 'shared', 'baked')
+
+  def __init__(self, grid:list[list[Any]]):
+    super().__init__(grid)
+    self.shared : bool = False
+
+    # data a chunk type builds from the grid, reused by every chunk sharing it and freed with it
+    self.baked  : Any  = None
 
 class Chunk(Element):
   'used for storing data in chunks for spatial hash'
@@ -23,24 +48,54 @@ class Chunk(Element):
     self.chunk_size  : int = chunk_width * tile_size
     self.tile_size   : int = tile_size
     self.default     : Any = default
-    self.grid        : list[list[Any]] = [[default for _ in range(chunk_width)] for _ in range(chunk_width)]
+    self.grid        : list[list[Any]] = [[default] * chunk_width for _ in range(chunk_width)]
     self.count       : int = 0
     self.outdated    : bool = True
+    self.version     : int = next(_chunk_versions)
+
+    # called with the chunk whenever it changes, set by the hash holding it
+    self.observer    : Any = None
+
+    # copy-on-write state shared with snapshots
+    self._shared     : bool = False
+    self._frozen     : bool = False
+
+  def _own(self) -> None:
+    'copies data shared with a snapshot or other chunks before it is edited'
+    if self._frozen:
+      raise RuntimeError('chunk snapshots are read-only')
+
+    if self._shared or (type(self.grid) == SharedGrid and self.grid.shared):
+      self.grid = [row[:] for row in self.grid]
+      self._shared = False
+
+    # an interned grid only this chunk uses is let go of instead of copied, the intern table drops it
+    elif type(self.grid) == SharedGrid:
+      self.grid = list(self.grid)
+
+  def invalidate(self) -> None:
+    'marks the chunk as changed, outdating any cached data built from it'
+    self.outdated = True
+    self.version = next(_chunk_versions)
+    if self.observer != None:
+      self.observer(self)
 
   def add_item(self, row:int, col:int, data:Any) -> None:
     'add item to chunk at <row>, <col>'
+    self._own()
     if self.grid[row][col] == self.default:
       self.count += 1
     self.grid[row][col] = data
-    self.outdated = True
+    self.invalidate()
 
   def del_item(self, row:int, col:int) -> Any:
     'returns item in chunk at <row>, <col> and deletes it'
+    self._own()
     if self.grid[row][col] != self.default:
       self.count -= 1
     item = self.grid[row][col]
     self.grid[row][col] = self.default
-    self.outdated = True
+    self.invalidate()
     return item
 
   def get_item(self, row:int, col:int) -> Any:
@@ -53,20 +108,58 @@ class Chunk(Element):
 
   def swap_item(self, row:int, col:int, data:Any) -> Any:
     'returns item in chunk at <row>, <col> and replaces with new item'
+    self._own()
     item = self.grid[row][col]
     self.grid[row][col] = data
-    self.outdated = True
+    self.invalidate()
     return item
 
+  def snapshot(self) -> 'Chunk':
+    'returns a read-only copy of the chunk sharing its grid, the grid is only copied once this chunk is edited'
+    self._shared = True
+    chunk = self.__class__.__new__(self.__class__)
+    chunk.__dict__.update(self.__dict__)
+    chunk._frozen = True
+    chunk.observer = None
+    return chunk
+
+  def read_block(self, rows:slice, cols:slice) -> list[list[Any]]:
+    'returns a copy of the items in a block of rows and cols of the chunk'
+    return [row[cols] for row in self.grid[rows]]
+
+  def write_block(self, row:int, col:int, block:list[list[Any]]) -> None:
+    'replaces the items of the chunk with a block of items starting at <row>, <col>'
+    self._own()
+    for i, items in enumerate(block):
+      self.grid[row + i][col:col + len(items)] = items
+
+    self.count = self.chunk_width ** 2 - sum(map(list.count, self.grid, itertools.repeat(self.default)))
+    self.invalidate()
+
+  def write_spans(self, spans:list[tuple[int, int, int]], data:Any) -> None:
+    'sets every item in the (row, col, cols) spans of the chunk to data, invalidating the chunk once'
+    self._own()
+    for row, col, cols in spans:
+      items = self.grid[row]
+      self.count -= cols - items[col:col + cols].count(self.default)
+      if data != self.default:
+        self.count += cols
+      items[col:col + cols] = [data] * cols
+
+    self.invalidate()
+
   def get_save_data(self) -> Any:
     'returns a saveable object with enough data to reconstruct this chunk'
     return None
 
   def reconstruct(self) -> None:
     'reconstructs chunk with given save data'
-    self.grid        : list[list[Any]] = [[self.default for _ in range(self.chunk_width)] for _ in range(self.chunk_width)]
+    if self._frozen:
+      raise RuntimeError('chunk snapshots are read-only')
+    self._shared = False
+    self.grid        : list[list[Any]] = [[self.default] * self.chunk_width for _ in range(self.chunk_width)]
     self.count       : int = 0
-    self.outdated    : bool = True
+    self.invalidate()
 
   def get_grid_positions(self, query:pygame.Rect) -> list:
     positions = []
@@ -84,6 +177,125 @@ class Chunk(Element):
   def __getstate__(self) -> object:
     return self.grid
 
+class ColdChunk:
+  'compressed grid of a chunk nobody has touched in a while, stands in for the chunk until it is next looked up'
+
+  # cold chunks can not be edited or interned, only thawed
+  _frozen : bool = True
+  _shared : bool = False
+
+  def __init__(self, chunk:Chunk):
+    self.chunk_pos   : point2d = chunk.chunk_pos
+    self.chunk_width : int = chunk.chunk_width
+    self.tile_size   : int = chunk.tile_size
+    self.default     : Any = chunk.default
+    self.count       : int = chunk.count
+    self.version     : int = chunk.version
+
+    # raw deflate with a small window and memory level, zlib's defaults spend most of their time setting up for a few hundred bytes
+    compressor = zlib.compressobj(1, zlib.DEFLATED, -9, 1)
+    self.body : bytes = compressor.compress(pickle.dumps(list(chunk.grid), pickle.HIGHEST_PROTOCOL)) + compressor.flush()
+
+  def thaw(self, hashmap:'SpatialHashMap') -> Chunk:
+    'returns the chunk rebuilt as a chunk of hashmap'
+    chunk = hashmap._create_chunk(self.chunk_pos, self.chunk_width, self.tile_size)
+    chunk.grid = pickle.loads(zlib.decompress(self.body, -9))
+    chunk.count = self.count
+    chunk.version = self.version
+    return chunk
+
+  def peek(self, hashmap:'SpatialHashMap') -> Chunk:
+    'returns a read-only copy of the chunk rebuilt as a chunk of hashmap, for reading without thawing it'
+    chunk = self.thaw(hashmap)
+    chunk._frozen = True
+    return chunk
+
+  def snapshot(self) -> 'ColdChunk':
+    'cold chunks are never edited so they are their own snapshot'
+    return self
+
+class ChunkStore(dict):
+  'chunk tag -> chunk dict of a spatial hash that compresses chunks left untouched and rebuilds them on the next lookup. values and items return chunks as stored, cold ones included'
+
+  def __init__(self, hashmap:'SpatialHashMap', chunks:dict, frames:int=None, seconds:float=None, budget:int=64, read_only:bool=False):
+    super().__init__(chunks)
+    self.hashmap   : SpatialHashMap = hashmap
+    self.read_only : bool = read_only
+    self.frames  : int   = frames
+    self.seconds : float = seconds
+    self.budget  : int   = budget
+
+    self.frame   : int   = 0
+    self.now     : float = time.perf_counter()
+    self.touched : dict[str, tuple[int, float]] = {}
+    self._sweep  : list[str] = []
+
+  def __getitem__(self, chunk_tag:str) -> Chunk:
+    # snapshots are read from other threads, they hand out read-only copies and leave the store and intern table alone
+    if self.read_only:
+      return self.peek(chunk_tag)
+
+    chunk = super().__getitem__(chunk_tag)
+    if isinstance(chunk, ColdChunk):
+      chunk = chunk.thaw(self.hashmap)
+      self.hashmap.intern_chunk(chunk)
+      super().__setitem__(chunk_tag, chunk)
+
+    self.touched[chunk_tag] = (self.frame, self.now)
+    return chunk
+
+  def get(self, chunk_tag:str, default:Any=None) -> Chunk:
+    return self[chunk_tag] if chunk_tag in self else default
+
+  def peek(self, chunk_tag:str, default:Any=None) -> Chunk:
+    'returns chunk <chunk_tag> for reading without thawing it into the store or counting it as used, cold chunks come back as read-only copies. otherwise returns default'
+    chunk = super().get(chunk_tag, default)
+    if isinstance(chunk, ColdChunk):
+      return chunk.peek(self.hashmap)
+    return chunk
+
+  def get_version(self, chunk_tag:str) -> int:
+    'returns the version of chunk <chunk_tag> as stored, cold or not, otherwise returns none'
+    chunk = super().get(chunk_tag, None)
+    return chunk.version if chunk != None else None
+
+  def clear(self) -> None:
+    super().clear()
+    self.touched.clear()
+    self._sweep = []
+
+  def is_cold(self, chunk_tag:str) -> bool:
+    'returns boolean if chunk <chunk_tag> is stored compressed'
+    return isinstance(super().__getitem__(chunk_tag), ColdChunk)
+
+  def update(self) -> None:
+    'called every frame, compresses up to budget chunks that have not been looked up for the set number of frames and seconds'
+    self.frame += 1
+    self.now = time.perf_counter()
+
+    # clock sweep over the chunk tags, a slice of them each frame
+    if self._sweep == []:
+      self._sweep = list(self.keys())
+
+    for _ in range(min(self.budget, len(self._sweep))):
+      chunk_tag = self._sweep.pop()
+      if chunk_tag not in self:
+        self.touched.pop(chunk_tag, None)
+        continue
+
+      chunk = super().__getitem__(chunk_tag)
+      if isinstance(chunk, ColdChunk) or chunk._frozen:
+        continue
+
+      frame, now = self.touched.setdefault(chunk_tag, (self.frame, self.now))
+      if self.frames != None and self.frame - frame < self.frames:
+        continue
+      if self.seconds != None and self.now - now < self.seconds:
+        continue
+
+      super().__setitem__(chunk_tag, ColdChunk(chunk))
+      del self.touched[chunk_tag]
+
 class SpatialHashMap(Element):
   'generic spatial hash implementation'
 
@@ -96,6 +308,15 @@ class SpatialHashMap(Element):
     self.CHUNK_WIDTH : int = chunk_width
     self.TILE_SIZE   : int = tile_size
 
+    # content hash -> grid shared by every chunk with those contents, held weakly so grids no chunk uses are dropped
+    self._interned   : weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    # weak references to the callbacks told the tag of every chunk that changes
+    self.listeners   : list[weakref.WeakMethod] = []
+
+    # called with a chunk tag before a region search reads that chunk, so a loader streaming it in can finish it first
+    self.chunk_source : Any = None
+
   @property
   def CHUNK_SIZE(self) -> int:
     'returns integer size of the chunk'
@@ -127,17 +348,48 @@ class SpatialHashMap(Element):
     world_grid_x, world_grid_y = self.get_world_grid_pos(worldx, worldy)
     return world_grid_x % self.CHUNK_WIDTH, world_grid_y % self.CHUNK_WIDTH
 
+  def _create_chunk(self, chunk_pos:point2d, chunk_width:int, tile_size:int) -> Chunk:
+    'returns a new empty chunk of this hash\'s chunk type, overload to set up chunks for a specific hash'
+    chunk = self.chunk_type(chunk_pos, chunk_width, tile_size)
+    chunk.observer = self._on_chunk_changed
+    return chunk
+
+  def add_listener(self, callback:Any) -> None:
+    'calls the bound method callback with the tag of every chunk edited, added or removed from now on. it is held weakly so listening does not keep its owner alive'
+    self.listeners.append(weakref.WeakMethod(callback))
+
+  def mark_changed(self, chunk_tag:str) -> None:
+    'tells listeners chunk <chunk_tag> changed, call when a chunk is added to or removed from the hash without being edited'
+    alive = True
+    for listener in self.listeners:
+      callback = listener()
+      if callback == None:
+        alive = False
+      else:
+        callback(chunk_tag)
+
+    if not alive:
+      self.listeners = [listener for listener in self.listeners if listener() != None]
+
+  def clear_chunks(self) -> None:
+    'removes every chunk from the hash, telling listeners each one changed'
+    removed = list(self.chunks)
+    self.chunks.clear()
+    for chunk_tag in removed:
+      self.mark_changed(chunk_tag)
+
+  def _on_chunk_changed(self, chunk:Chunk) -> None:
+    'called by chunks of the hash when they change'
+    if self.listeners != []:
+      self.mark_changed(self._format_chunk_tag(int(chunk.chunk_pos.x), int(chunk.chunk_pos.y)))
+
   def add_tile(self, worldx:float, worldy:float, data:Any) -> None:
     'add tile data to this world tile position'
     chunkx, chunky = self.get_chunk_pos(worldx, worldy)
     chunk_tag = self._format_chunk_tag(chunkx, chunky)
 
     if chunk_tag not in self.chunks:
-      self.chunks[chunk_tag] = self.chunk_type(
-        point2d(chunkx, chunky),
-        self.CHUNK_WIDTH,
-        self.TILE_SIZE
-      )
+      self.chunks[chunk_tag] = self._create_chunk(point2d(chunkx, chunky), self.CHUNK_WIDTH, self.TILE_SIZE)
 
     col, row = self.get_chunk_grid_pos(worldx, worldy)
     self.chunks[chunk_tag].add_item(row, col, data)
@@ -211,16 +463,340 @@ class SpatialHashMap(Element):
 
     return positions
 
+  def snapshot(self) -> 'SpatialHashMap':
+    'returns a read-only copy of the spatial hash that later edits to this one do not affect, chunk grids are shared until edited'
+    hashmap = copy.copy(self)
+    chunks = {chunk_tag:chunk.snapshot() for chunk_tag, chunk in self.chunks.items()}
+
+    hashmap._interned = weakref.WeakValueDictionary()
+    hashmap.listeners = []
+    hashmap.chunk_source = None
+
+    # cold chunks stay compressed in the snapshot and are rebuilt read-only on the reading thread
+    if isinstance(self.chunks, ChunkStore):
+      chunks = ChunkStore(hashmap, chunks, read_only=True)
+
+    hashmap.chunks = types.MappingProxyType(chunks)
+    return hashmap
+
+  def set_cold_chunks(self, frames:int=None, seconds:float=None, budget:int=64) -> None:
+    'compresses chunks in memory once they go unused for <frames> updates and <seconds>, checking up to budget chunks each update. both none turns it off and rebuilds every chunk'
+    if frames == None and seconds == None:
+      if isinstance(self.chunks, ChunkStore):
+        self.chunks = {chunk_tag:self.chunks[chunk_tag] for chunk_tag in list(self.chunks)}
+      return
+
+    if not isinstance(self.chunks, ChunkStore):
+      self.chunks = ChunkStore(self, self.chunks)
+    self.chunks.frames = frames
+    self.chunks.seconds = seconds
+    self.chunks.budget = budget
+
+  def update(self) -> None:
+    'called every frame, compresses chunks that have gone cold'
+    if isinstance(self.chunks, ChunkStore):
+      self.chunks.update()
+
+  def peek_chunk(self, chunk_tag:str, default:Any=None) -> Chunk:
+    'returns chunk <chunk_tag> for reading without rebuilding it into the hash if cold, otherwise returns default. bulk readers use this so they do not thaw every chunk they look at'
+    if isinstance(self.chunks, ChunkStore):
+      return self.chunks.peek(chunk_tag, default)
+    return self.chunks.get(chunk_tag, default)
+
+  def get_chunk_version(self, chunk_tag:str) -> int:
+    'returns the version of chunk <chunk_tag> without rebuilding it if cold, otherwise returns none'
+    if isinstance(self.chunks, ChunkStore):
+      return self.chunks.get_version(chunk_tag)
+
+    chunk = self.chunks.get(chunk_tag, None)
+    return chunk.version if chunk != None else None
+
+  def _get_tile_bounds(self, query:pygame.Rect) -> tuple[int, int, int, int]:
+    'returns col, row, cols, rows of the tiles overlapping the query region'
+    col, row = self.get_world_grid_pos(query.left, query.top)
+    last_col, last_row = self.get_world_grid_pos(query.right - 1, query.bottom - 1)
+    return col, row, last_col - col + 1, last_row - row + 1
+
+  def _get_region(self, query:pygame.Rect) -> tuple[int, int, int, int]:
+    'returns col, row, cols, rows of the tiles overlapping the query region'
+    if np == None:
+      raise ImportError('numpy is required to export and import regions')
+
+    # an empty or inverted query covers no tiles
+    col, row, cols, rows = self._get_tile_bounds(query)
+    return col, row, max(cols, 0), max(rows, 0)
+
+  def _get_region_blocks(self, col:int, row:int, cols:int, rows:int, include_empty:bool=False) -> list:
+    'returns (chunk tag, chunk rows, chunk cols, region rows, region cols) slices of every chunk overlapping a region of tiles'
+    blocks = []
+    for chunky in range(row // self.CHUNK_WIDTH, (row + rows - 1) // self.CHUNK_WIDTH + 1):
+      top = max(row, chunky * self.CHUNK_WIDTH)
+      bottom = min(row + rows, (chunky + 1) * self.CHUNK_WIDTH)
+
+      for chunkx in range(col // self.CHUNK_WIDTH, (col + cols - 1) // self.CHUNK_WIDTH + 1):
+        chunk_tag = self._format_chunk_tag(chunkx, chunky)
+        if chunk_tag not in self.chunks and not include_empty:
+          continue
+
+        left = max(col, chunkx * self.CHUNK_WIDTH)
+        right = min(col + cols, (chunkx + 1) * self.CHUNK_WIDTH)
+        blocks.append((
+          chunk_tag,
+          slice(top - chunky * self.CHUNK_WIDTH, bottom - chunky * self.CHUNK_WIDTH),
+          slice(left - chunkx * self.CHUNK_WIDTH, right - chunkx * self.CHUNK_WIDTH),
+          slice(top - row, bottom - row),
+          slice(left - col, right - col)
+        ))
+
+    return blocks
+
+  def _write_region(self, col:int, row:int, region:list[list[Any]]) -> None:
+    'writes a list of rows of items into every chunk overlapping the region, creating and deleting chunks as needed'
+    rows, cols = len(region), len(region[0])
+    with paused_gc():
+      for chunk_tag, chunk_rows, chunk_cols, region_rows, region_cols in self._get_region_blocks(col, row, cols, rows, include_empty=True):
+        if chunk_tag not in self.chunks:
+          chunk_pos = point2d(*self._unformat_chunk_tag(chunk_tag))
+          self.chunks[chunk_tag] = self._create_chunk(chunk_pos, self.CHUNK_WIDTH, self.TILE_SIZE)
+
+        block = [items[region_cols] for items in region[region_rows]]
+        self.chunks[chunk_tag].write_block(chunk_rows.start, chunk_cols.start, block)
+
+        if self.chunks[chunk_tag].count == 0:
+          del self.chunks[chunk_tag]
+        else:
+          self.intern_chunk(self.chunks[chunk_tag])
+
+  def _get_default(self) -> Any:
+    'returns the item of an empty tile'
+    for chunk in self.chunks.values():
+      return chunk.default
+    return self._create_chunk(point2d(0, 0), self.CHUNK_WIDTH, self.TILE_SIZE).default
+
+  def _get_row_items(self, chunkx:int, row:int, cache:dict) -> list[Any]:
+    'returns the items of tile row <row> within chunk column <chunkx>, otherwise returns none if that chunk is empty'
+    key = (chunkx, row)
+    if key not in cache:
+      if self.chunk_source != None:
+        self.chunk_source(self._format_chunk_tag(chunkx, row // self.CHUNK_WIDTH))
+      chunk = self.chunks.get(self._format_chunk_tag(chunkx, row // self.CHUNK_WIDTH), None)
+      cache[key] = chunk.grid[row % self.CHUNK_WIDTH] if chunk != None else None
+    return cache[key]
+
+  def _match(self, col:int, row:int, target:Any, default:Any, cache:dict) -> bool:
+    'returns boolean if the tile at col, row holds target'
+    items = self._get_row_items(col // self.CHUNK_WIDTH, row, cache)
+    return (items[col % self.CHUNK_WIDTH] if items != None else default) == target
+
+  def _scan_row(self, col:int, row:int, step:int, stop:int, target:Any, default:Any, cache:dict) -> int:
+    'returns the last col reached walking from <col> towards <stop> in steps of <step> over tiles holding target, a chunk row at a time'
+    while col != stop:
+      chunkx = (col + step) // self.CHUNK_WIDTH
+      chunk_left = chunkx * self.CHUNK_WIDTH
+      end = min(chunk_left + self.CHUNK_WIDTH - 1, stop) if step > 0 else max(chunk_left, stop)
+
+      items = self._get_row_items(chunkx, row, cache)
+      if items == None:
+        if target != default:
+          return col
+        col = end
+        continue
+
+      for next_col in range(col + step, end + step, step):
+        if items[next_col - chunk_left] != target:
+          return col
+        col = next_col
+
+    return col
+
+  def _is_filled(self, filled:dict, col:int, row:int) -> int:
+    'returns the last col of the span in <filled> covering col, row, otherwise returns none'
+    spans = filled.get(row, [])
+    i = bisect.bisect_right(spans, (col, float('inf'))) - 1
+    if i >= 0 and spans[i][1] >= col:
+      return spans[i][1]
+    return None
+
+  def select_region(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'returns (row, col, cols) spans in tile scale of the tiles holding the same item as the tile at worldx, worldy and 4-way connected to it, kept within bounds. otherwise returns none if more than limit tiles are connected'
+    start_col, start_row = self.get_world_grid_pos(worldx, worldy)
+
+    # without bounds a region of at most limit tiles can not reach further than limit tiles away
+    if bounds == None:
+      min_col, min_row, max_col, max_row = start_col - limit, start_row - limit, start_col + limit, start_row + limit
+    else:
+      min_col, min_row, cols, rows = self._get_tile_bounds(bounds)
+      max_col, max_row = min_col + cols - 1, min_row + rows - 1
+      if not (min_col <= start_col <= max_col and min_row <= start_row <= max_row):
+        return []
+
+    default = self._get_default()
+    cache = {}
+    items = self._get_row_items(start_col // self.CHUNK_WIDTH, start_row, cache)
+    target = items[start_col % self.CHUNK_WIDTH] if items != None else default
+
+    # scanline fill, each seed is widened into a full span and the rows above and below it are searched for new seeds
+    filled = {}
+    spans = []
+    count = 0
+    seeds = [(start_col, start_row)]
+    while seeds:
+      col, row = seeds.pop()
+      if self._is_filled(filled, col, row) != None:
+        continue
+
+      left = self._scan_row(col, row, -1, min_col, target, default, cache)
+      right = self._scan_row(col, row, 1, max_col, target, default, cache)
+      bisect.insort(filled.setdefault(row, []), (left, right))
+      spans.append((row, left, right - left + 1))
+
+      count += right - left + 1
+      if count > limit:
+        return None
+
+      for next_row in (row - 1, row + 1):
+        if not min_row <= next_row <= max_row:
+          continue
+
+        col = left
+        while col <= right:
+          filled_right = self._is_filled(filled, col, next_row)
+          if filled_right != None:
+            col = filled_right + 1
+            continue
+
+          if self._match(col, next_row, target, default, cache):
+            seeds.append((col, next_row))
+            col = self._scan_row(col, next_row, 1, right, target, default, cache)
+          col += 1
+
+    return spans
+
+  def _get_chunk_spans(self, spans:list[tuple[int, int, int]]) -> dict[str, list[tuple[int, int, int]]]:
+    'returns the (row, col, cols) spans in tile scale split up by chunk and converted to chunk scale, keyed by chunk tag'
+    chunk_spans = {}
+    for row, col, cols in spans:
+      chunky = row // self.CHUNK_WIDTH
+      end = col + cols
+      while col < end:
+        chunkx = col // self.CHUNK_WIDTH
+        chunk_end = min(end, (chunkx + 1) * self.CHUNK_WIDTH)
+        chunk_spans.setdefault(self._format_chunk_tag(chunkx, chunky), []).append((row - chunky * self.CHUNK_WIDTH, col - chunkx * self.CHUNK_WIDTH, chunk_end - col))
+        col = chunk_end
+    return chunk_spans
+
+  def get_cells(self, spans:list[tuple[int, int, int]]) -> list[list[Any]]:
+    'returns the items of every (row, col, cols) span in tile scale, in the order of spans'
+    default = self._get_default()
+    cache = {}
+    cells = []
+    for row, col, cols in spans:
+      items = []
+      for chunkx in range(col // self.CHUNK_WIDTH, (col + cols - 1) // self.CHUNK_WIDTH + 1):
+        chunk_left = chunkx * self.CHUNK_WIDTH
+        left, right = max(col, chunk_left) - chunk_left, min(col + cols, chunk_left + self.CHUNK_WIDTH) - chunk_left
+        row_items = self._get_row_items(chunkx, row, cache)
+        items.extend(row_items[left:right] if row_items != None else [default] * (right - left))
+      cells.append(items)
+    return cells
+
+  def fill_cells(self, spans:list[tuple[int, int, int]], data:Any) -> None:
+    'sets every tile in the (row, col, cols) spans in tile scale to data, each chunk touched is written and invalidated once'
+    for chunk_tag, chunk_spans in self._get_chunk_spans(spans).items():
+      if chunk_tag not in self.chunks:
+        chunk_pos = point2d(*self._unformat_chunk_tag(chunk_tag))
+        self.chunks[chunk_tag] = self._create_chunk(chunk_pos, self.CHUNK_WIDTH, self.TILE_SIZE)
+
+      self.chunks[chunk_tag].write_spans(chunk_spans, data)
+
+      if self.chunks[chunk_tag].count == 0:
+        del self.chunks[chunk_tag]
+      else:
+        self.intern_chunk(self.chunks[chunk_tag])
+
+  def del_cells(self, spans:list[tuple[int, int, int]]) -> None:
+    'empties every tile in the (row, col, cols) spans in tile scale, deleting chunks that become empty'
+    default = self._get_default()
+    for chunk_tag, chunk_spans in self._get_chunk_spans(spans).items():
+      if chunk_tag not in self.chunks:
+        continue
+
+      self.chunks[chunk_tag].write_spans(chunk_spans, default)
+
+      if self.chunks[chunk_tag].count == 0:
+        del self.chunks[chunk_tag]
+
+  def fill_region(self, worldx:float, worldy:float, data:Any, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'bucket fills the region selected from worldx, worldy with data and returns its spans, otherwise returns none and changes nothing if the region is larger than limit'
+    spans = self.select_region(worldx, worldy, bounds, limit)
+    if spans != None and spans != [] and self.get_cells(spans[:1])[0][0] != data:
+      self.fill_cells(spans, data)
+    return spans
+
+  def del_region(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'empties the region selected from worldx, worldy and returns its spans, otherwise returns none and changes nothing if the region is larger than limit'
+    if not self.check_tile(worldx, worldy):
+      return []
+
+    spans = self.select_region(worldx, worldy, bounds, limit)
+    if spans != None:
+      self.del_cells(spans)
+    return spans
+
+  def intern_chunk(self, chunk:Chunk) -> None:
+    'makes chunk share one grid with every other interned chunk of the same contents, chunks copy it before editing only once a second chunk uses it. call from the thread owning the hash'
+    if chunk._frozen or type(chunk.grid) == SharedGrid:
+      return
+
+    key = hash(tuple(map(tuple, chunk.grid)))
+    grid = self._interned.get(key, None)
+    if grid == None:
+      chunk.grid = SharedGrid(chunk.grid)
+      self._interned[key] = chunk.grid
+
+    # grids with the same hash but different contents are left unshared
+    elif grid == chunk.grid:
+      chunk.grid = grid
+      grid.shared = True
+
+  def intern_chunks(self) -> None:
+    'interns every chunk'
+    for chunk in self.chunks.values():
+      self.intern_chunk(chunk)
+
   def get_save_data(self) -> Any:
     chunk_data = {}
 
-    for chunk_pos in self.chunks:
-      chunk_data[chunk_pos] = self.chunks[chunk_pos].get_save_data()
+    # chunks sharing a grid are encoded once, as a body every one of them references by index
+    shared = {}
+    for chunk_tag, chunk in self.chunks.items():
+      if isinstance(chunk, ColdChunk):
+        chunk_data[chunk_tag] = chunk.thaw(self).get_save_data()
+        continue
+
+      if type(chunk.grid) != SharedGrid:
+        chunk_data[chunk_tag] = chunk.get_save_data()
+        continue
+
+      if id(chunk.grid) not in shared:
+        shared[id(chunk.grid)] = (chunk.get_save_data(), [])
+      shared[id(chunk.grid)][1].append(chunk_tag)
+
+    bodies = []
+    for body, chunk_tags in shared.values():
+      if len(chunk_tags) == 1:
+        chunk_data[chunk_tags[0]] = body
+        continue
+
+      for chunk_tag in chunk_tags:
+        chunk_data[chunk_tag] = len(bodies)
+      bodies.append(body)
 
     return {
       'width':self.CHUNK_WIDTH,
       'size':self.TILE_SIZE,
-      'data':chunk_data
+      'data':chunk_data,
+      'bodies':bodies
     }
 
   def save_to_path(self, path:str) -> None:
@@ -236,14 +812,29 @@ class SpatialHashMap(Element):
     chunk_width = data['width']
     tile_size   = data['size']
 
-    self.chunks.clear()
+    self.clear_chunks()
 
     for chunk_hash in chunk_data:
-
-      chunk_pos = point2d(*self._unformat_chunk_tag(chunk_hash))
-      self.chunks[chunk_hash] = self.chunk_type(chunk_pos, chunk_width, tile_size)
-
-      self.chunks[chunk_hash].reconstruct(chunk_data[chunk_hash])
+      self.chunks[chunk_hash] = self.build_chunk(chunk_hash, self.get_chunk_body(data, chunk_data[chunk_hash]), chunk_width, tile_size)
+      self.intern_chunk(self.chunks[chunk_hash])
+      self.mark_changed(chunk_hash)
+
+  def get_chunk_body(self, data:Any, chunk_data:Any) -> Any:
+    'returns the save data of a chunk in hash save data, following an index into the shared chunk bodies'
+    if isinstance(chunk_data, int):
+      return data['bodies'][chunk_data]
+    return chunk_data
+
+  def build_chunk(self, chunk_tag:str, chunk_data:Any, chunk_width:int, tile_size:int) -> Chunk:
+    'returns a chunk reconstructed from its save data without adding it to the hash or interning it, safe to call from other threads. whoever adds it marks it changed'
+    chunk_pos = point2d(*self._unformat_chunk_tag(chunk_tag))
+    chunk = self._create_chunk(chunk_pos, chunk_width, tile_size)
+
+    # listeners are only called on the thread owning the hash, so the chunk is not observed until it is rebuilt
+    chunk.observer = None
+    chunk.reconstruct(chunk_data)
+    chunk.observer = self._on_chunk_changed
+    return chunk
 
   def load_from_path(self, path:str) -> None:
     'base load method for the spatial hash tree to a json'
@@ -307,6 +898,23 @@ class LayeredSHMap(Element):
     'updates the tile texture info in the world at worldx, worldy in the current editing layer'
     return self._texture_layer_maps[self.editing_layer].update_tile_texture(worldx, worldy, bitmask, variant)
 
+  def fill_region(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'bucket fills the connected region at worldx, worldy in the current editing layer with the texture data and returns its spans'
+    return self._texture_layer_maps[self.editing_layer].fill_region(worldx, worldy, sheet_id, tex_row, tex_col, bounds, limit)
+
+  def del_region(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'empties the connected region at worldx, worldy in the current editing layer and returns its spans'
+    return self._texture_layer_maps[self.editing_layer].del_region(worldx, worldy, bounds, limit)
+
+  def intern_chunks(self) -> None:
+    'interns the chunks of every layer'
+    for hashmap in self._texture_layer_maps.values():
+      hashmap.intern_chunks()
+
+  def get_layer(self, index:int) -> SpatialHashMap:
+    'returns the spatial hash of layer <index>, 0 being the background'
+    return self._texture_layer_maps[self._texture_layers[index]]
+
   def get_map(self, query:pygame.Rect) -> list[point2d, pygame.Surface]:
     'returns list of pygame.Surfaces representing the map in the query region, ordered by layer'
     textures = []
@@ -314,6 +922,12 @@ class LayeredSHMap(Element):
       textures.append(self._texture_layer_maps[layer].get_terrain(query))
     return textures
   
+  def snapshot(self) -> 'LayeredSHMap':
+    'returns a read-only copy of every layer that later edits to this one do not affect'
+    layered = copy.copy(self)
+    layered._texture_layer_maps = {layer:hashmap.snapshot() for layer, hashmap in self._texture_layer_maps.items()}
+    return layered
+
   def get_save_data(self) -> Any:
     return {
       'bg':self._texture_layer_maps['-1'].get_save_data(),
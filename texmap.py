@@ -1,13 +1,19 @@
 import pygame
+import itertools
 
 from typing import Any
 
 try:
-  from .spatialhash import Chunk, SpatialHashMap
-  from .utils       import point2d, reshape, _base64chars
+  import numpy as np
+except ImportError:
+  np = None
+
+try:
+  from .spatialhash import Chunk, SpatialHashMap, SharedGrid
+  from .utils       import point2d, reshape, paused_gc, _base64chars
 except:
-  from spatialhash  import Chunk, SpatialHashMap
-  from utils        import point2d, reshape, _base64chars
+  from spatialhash  import Chunk, SpatialHashMap, SharedGrid
+  from utils        import point2d, reshape, paused_gc, _base64chars
 
 
 class TexChunk(Chunk):
@@ -16,8 +22,10 @@ class TexChunk(Chunk):
   def __init__(self, chunk_pos:point2d, chunk_width:int, tile_size:int):
     super().__init__(None, chunk_pos=chunk_pos, chunk_width=chunk_width, tile_size=tile_size)
     self.textures     : list            = []
+    self.animated     : list            = []
     self.cached_surf  : pygame.Surface  = None
     self.surf_buffer  : int             = 2
+    self.bake_cache   : Any             = None
 
   def get_textures(self) -> list:
     'returns list of (point2d, (sheet id, texture row, texture col)) of entire chunk'
@@ -31,19 +39,59 @@ class TexChunk(Chunk):
     return self.textures    
   
   def get_chunk_texture(self) -> pygame.Surface:
-    'returns the rendered chunk surface'
+    'returns the rendered chunk surface, animated textures are left out of it and tracked separately'
     if self.outdated:
-      self.cached_surf = pygame.Surface((self.chunk_size + self.surf_buffer, self.chunk_size + self.surf_buffer))
-      self.cached_surf.set_colorkey((0, 0, 0))
-
-      for (pos, (sheet_id, tex_row, tex_col)) in self.get_textures():
-        texture = self.elements['Sheets'].get_texture(sheet_id, tex_row, tex_col)
-        offx, offy = self.elements['Sheets'].get_texture_offsets(sheet_id, tex_row, tex_col)
-        self.cached_surf.blit(texture, (pos.x + offx + self.surf_buffer, pos.y + offy + self.surf_buffer))
+      # another chunk with the same interned grid may have baked it already
+      if type(self.grid) == SharedGrid and self.grid.baked != None:
+        self.cached_surf, self.animated = self.grid.baked
+        self.outdated = False
+        return self.cached_surf
+
+      static = []
+      self.animated = []
+      for texture in self.get_textures():
+        if self.elements['Sheets'].is_animated(*texture[1]):
+          self.animated.append(texture)
+        else:
+          static.append(texture)
+
+      self.cached_surf = self.bake_cache.load(self) if self.bake_cache != None else None
+      if self.cached_surf == None:
+        self.cached_surf = self._bake(static)
+        if self.bake_cache != None:
+          self.bake_cache.store(self, self.cached_surf)
+
+      if type(self.grid) == SharedGrid:
+        self.grid.baked = (self.cached_surf, self.animated)
 
       self.outdated = False
 
     return self.cached_surf
+
+  def _bake(self, textures:list) -> pygame.Surface:
+    'returns a new surface with <textures> drawn on it'
+    surf = pygame.Surface((self.chunk_size + self.surf_buffer, self.chunk_size + self.surf_buffer))
+    surf.set_colorkey((0, 0, 0))
+
+    for (pos, (sheet_id, tex_row, tex_col)) in textures:
+      texture = self.elements['Sheets'].get_texture(sheet_id, tex_row, tex_col)
+      offx, offy = self.elements['Sheets'].get_texture_offsets(sheet_id, tex_row, tex_col)
+      surf.blit(texture, (pos.x + offx + self.surf_buffer, pos.y + offy + self.surf_buffer))
+
+    return surf
+
+  def get_animated_textures(self, t:float) -> list:
+    'returns list of (point2d, pygame.Surface) of the animated textures at time t, relative to the rendered chunk surface'
+    self.get_chunk_texture()
+
+    textures = []
+    for (pos, (sheet_id, tex_row, tex_col)) in self.animated:
+      frame_row, frame_col = self.elements['Sheets'].get_animation_frame(sheet_id, tex_row, tex_col, t)
+      texture = self.elements['Sheets'].get_texture(sheet_id, frame_row, frame_col)
+      offx, offy = self.elements['Sheets'].get_texture_offsets(sheet_id, frame_row, frame_col)
+      textures.append((point2d(pos.x + offx + self.surf_buffer, pos.y + offy + self.surf_buffer), texture))
+
+    return textures
   
   def update_tile_texture(self, row:int, col:int, new_bitmask:int=-1, new_variant:int=-1) -> Any:
     'updates the tile texture info at row, col'
@@ -135,13 +183,32 @@ class TexSHMap(SpatialHashMap):
 
   def __init__(self, chunk_width:int=16, tile_size:int=16):
     super().__init__(TexChunk, chunk_width=chunk_width, tile_size=tile_size)
+    self.bake_cache : Any  = None
+
+  def _create_chunk(self, chunk_pos:point2d, chunk_width:int, tile_size:int) -> TexChunk:
+    chunk = super()._create_chunk(chunk_pos, chunk_width, tile_size)
+    chunk.bake_cache = self.bake_cache
+    return chunk
+
+  def set_bake_cache(self, bake_cache:Any) -> None:
+    'sets the on-disk cache chunks load their rendered surface from before baking it, none to disable'
+    self.bake_cache = bake_cache
+    for chunk in self.chunks.values():
+      chunk.bake_cache = bake_cache
 
   def add_tile(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int) -> None:
     'adds the texture data to the world at worldx, worldy'
     super().add_tile(worldx, worldy, (sheet_id, tex_row, tex_col))
   
-  def get_terrain(self, query:pygame.Rect, pad:bool=True) -> list[Any]:
-    'returns list of pygame.Surfaces representing the map in the query region'
+  def fill_region(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'bucket fills the connected region at worldx, worldy with the texture data and returns its spans'
+    return super().fill_region(worldx, worldy, (sheet_id, tex_row, tex_col), bounds, limit)
+  
+  def get_terrain(self, query:pygame.Rect, pad:bool=True, anim_time:float=None) -> list[Any]:
+    'returns list of pygame.Surfaces representing the map in the query region, each chunk followed by its animated textures'
+    if anim_time == None:
+      anim_time = self.elements['Window'].rt
+
     tags = self.get_chunks_in_rect(query, pad)
     
     textures = []
@@ -150,9 +217,57 @@ class TexSHMap(SpatialHashMap):
       chunk_pos.x *= self.CHUNK_SIZE
       chunk_pos.y *= self.CHUNK_SIZE
       textures.append((chunk_pos, self.chunks[tag].get_chunk_texture()))
+      textures.extend(self.get_animated_textures(tag, anim_time))
 
     return textures
 
+  def get_animated_textures(self, chunk_tag:str, anim_time:float) -> list[Any]:
+    'returns list of (point2d, pygame.Surface) in world coords of the animated textures of chunk <chunk_tag>'
+    chunk = self.chunks[chunk_tag]
+    chunk_pos = chunk.chunk_pos.copy()
+    chunk_pos.x *= self.CHUNK_SIZE
+    chunk_pos.y *= self.CHUNK_SIZE
+
+    return [(chunk_pos + pos, texture) for (pos, texture) in chunk.get_animated_textures(anim_time)]
+
+  def export_region(self, query:pygame.Rect) -> tuple['np.ndarray', list[tuple]]:
+    'returns the textures overlapping the query region as a 2d int32 array indexed [row, col] of palette indices, -1 being empty, and the palette of (sheet id, texture row, texture col)'
+    col, row, cols, rows = self._get_region(query)
+    region = np.full((rows, cols), -1, np.int32)
+    palette = []
+    lookup = {None:-1}
+
+    # id of grid -> (grid, palette indices of the whole chunk), chunks sharing a grid are converted once
+    blocks = {}
+
+    with paused_gc():
+      for chunk_tag, chunk_rows, chunk_cols, region_rows, region_cols in self._get_region_blocks(col, row, cols, rows):
+        grid = self.peek_chunk(chunk_tag).grid
+        if id(grid) not in blocks:
+          cells = list(itertools.chain.from_iterable(grid))
+          for data in set(cells).difference(lookup):
+            lookup[data] = len(palette)
+            palette.append(data)
+          indices = np.fromiter(map(lookup.__getitem__, cells), np.int32, len(cells)).reshape(len(grid), -1)
+          blocks[id(grid)] = (grid, indices)
+
+        region[region_rows, region_cols] = blocks[id(grid)][1][chunk_rows, chunk_cols]
+
+    return region, palette
+
+  def import_region(self, worldx:float, worldy:float, region:'np.ndarray', palette:list[tuple]) -> None:
+    'writes a 2d array indexed [row, col] of palette indices into the world with [0, 0] at the tile at worldx, worldy, -1 being empty'
+    col, row, _, _ = self._get_region(pygame.Rect(worldx, worldy, 1, 1))
+
+    # the last entry is empty so -1 indices map to none
+    values = np.empty(len(palette) + 1, object)
+    for i, data in enumerate(palette):
+      values[i] = tuple(data)
+    values[-1] = None
+
+    with paused_gc():
+      self._write_region(col, row, values[np.asarray(region)].tolist())
+
   def update_tile_texture(self, worldx:float, worldy:float, new_bitmask:int=-1, new_variant:int=-1) -> Any:
     'updates the tile texture info at row, col'
     chunk_tag = self.get_chunk_tag(worldx, worldy)
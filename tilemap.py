@@ -2,12 +2,17 @@ import pygame
 
 from typing import Any
 
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
 try:
   from .spatialhash import Chunk, SpatialHashMap
-  from .utils       import point2d, reshape
+  from .utils       import point2d, reshape, paused_gc
 except:
   from spatialhash  import Chunk, SpatialHashMap
-  from utils        import point2d, reshape
+  from utils        import point2d, reshape, paused_gc
 
 class TileChunk(Chunk):
   'chunk element used for storing collidable tile hitboxes'
@@ -101,7 +106,7 @@ class TileChunk(Chunk):
         i += 1
       curr = 1 if curr == 0 else 0
 
-    self.optimize()
+    # collidables are meshed on first use by get_collidables
 
 class TileSHMap(SpatialHashMap):
   'spatial hash structure for storing collision chunks'
@@ -117,6 +122,10 @@ class TileSHMap(SpatialHashMap):
     'deletes a collision hitbox from the world at worldx, worldy'
     super().del_tile(worldx, worldy, del_empty=del_empty)
 
+  def fill_region(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list[tuple[int, int, int]]:
+    'bucket fills the connected region at worldx, worldy with collision hitboxes and returns its spans'
+    return super().fill_region(worldx, worldy, 1, bounds, limit)
+
   def get_terrain(self, query:pygame.Rect, pad:bool=True) -> list[pygame.Rect]:
     'returns list of pygame.Rects representing collidable terrain in the query region'
     tags = self.get_chunks_in_rect(query, pad)
@@ -126,3 +135,19 @@ class TileSHMap(SpatialHashMap):
       terrain.extend(self.chunks[tag].get_collidables())
 
     return terrain
+
+  def export_region(self, query:pygame.Rect) -> 'np.ndarray':
+    'returns the tiles overlapping the query region as a 2d uint8 array indexed [row, col], 1 being a collision tile'
+    col, row, cols, rows = self._get_region(query)
+    region = np.zeros((rows, cols), np.uint8)
+
+    for chunk_tag, chunk_rows, chunk_cols, region_rows, region_cols in self._get_region_blocks(col, row, cols, rows):
+      region[region_rows, region_cols] = np.array(self.chunks[chunk_tag].grid, np.uint8)[chunk_rows, chunk_cols]
+
+    return region
+
+  def import_region(self, worldx:float, worldy:float, region:'np.ndarray') -> None:
+    'writes a 2d array indexed [row, col] into the world with [0, 0] at the tile at worldx, worldy, nonzero cells being collision tiles'
+    col, row, _, _ = self._get_region(pygame.Rect(worldx, worldy, 1, 1))
+    with paused_gc():
+      self._write_region(col, row, (np.asarray(region) != 0).astype(np.uint8).tolist())
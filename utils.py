@@ -1,5 +1,8 @@
+import gc
+
 from functools import partial
 from dataclasses import dataclass
+from contextlib import contextmanager
 
 _base64chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
 
@@ -12,6 +15,17 @@ def read_file(path:str) -> str:
 def bind_func(func:callable, *args, **kwargs) -> callable:
   return partial(func, *args, **kwargs)
 
+@contextmanager
+def paused_gc():
+  'pauses the cyclic garbage collector, used around bulk allocations so it does not rescan everything repeatedly'
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if enabled:
+      gc.enable()
+
 def contains(x:float, y:float, w:float, h:float, pos:'point2d') -> bool:
   return x <= pos.x <= x + w and y <= pos.y <= y + h
 
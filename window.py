@@ -3,11 +3,11 @@ import time
 
 try:
   from .elems import Singleton
-  from .mgl   import MGL, RenderObject
+  from .mgl   import MGL, RenderObject, PostProcess
   from .utils import read_file
 except:
   from elems  import Singleton
-  from mgl    import MGL, RenderObject
+  from mgl    import MGL, RenderObject, PostProcess
   from utils  import read_file
 
 
@@ -39,7 +39,11 @@ class Window(Singleton):
 
     self.bg_color : tuple = 30, 35, 40
 
-    self.render_obj : RenderObject = None
+    self.dirty_rects     : bool  = False
+    self.dirty_threshold : float = 0.5
+
+    self.render_obj   : RenderObject = None
+    self.post_process : PostProcess  = None
 
     # if mgl is toggled, have rendering go through the mgl pipeline
     if opengl:
@@ -53,10 +57,33 @@ class Window(Singleton):
     'resize the application window'
     old_size = self.window.get_size()
 
+    if self.dirty_rects:
+      self.elements['Render'].untrack(self.window)
+
     self.window = pygame.display.set_mode((new_width, new_height), self.flags)
 
+    # pooled render targets are reallocated at the new size as passes ask for them
+    if self.render_obj:
+      self.elements['MGL'].resize((new_width, new_height))
+
+    if self.dirty_rects:
+      self.elements['Render'].track(self.window, self.bg_color, self.dirty_threshold)
+
     return old_size
 
+  def set_post_process(self, post_process:PostProcess) -> None:
+    'draws the window through a post processing chain instead of the default render object, none to go back. needs opengl'
+    self.post_process = post_process
+
+  def set_dirty_rects(self, enabled:bool=True, threshold:float=0.5) -> None:
+    'only restores and presents the areas the render singleton changed each frame instead of the whole window, with a full flip when they cover more than threshold of it. function draws queued without a dirty rect make their frame a full redraw. with opengl the window is still uploaded and flipped whole, only the restore and redraw work is saved'
+    self.dirty_rects = enabled
+    self.dirty_threshold = threshold
+    if enabled:
+      self.elements['Render'].track(self.window, self.bg_color, threshold)
+    else:
+      self.elements['Render'].untrack(self.window)
+
   def show_debug(self, additional:str='') -> None:
     'adds framerate information to the application title'
     t = time.time()
@@ -71,12 +98,25 @@ class Window(Singleton):
     if uniforms == None:
       uniforms = {}
 
-    if self.render_obj:
+    if self.post_process:
+      self.post_process.render(self.window, uniforms=uniforms)
+    elif self.render_obj:
       if self.render_obj.default and ('surf' not in uniforms):
         uniforms['surf'] = self.window
       self.render_obj.render(uniforms=uniforms)
-    pygame.display.flip()
-    self.window.fill(self.bg_color)
+
+    # in dirty rect mode the render singleton restores the background itself, only where it drew. the window keeps
+    # everything else from earlier frames, so it is not filled even with opengl, which presents it with a full flip
+    rects = None
+    if self.dirty_rects:
+      rects = self.elements['Render'].get_dirty(self.window)
+    if rects != None and not self.render_obj:
+      pygame.display.update(rects)
+    else:
+      pygame.display.flip()
+
+    if not self.dirty_rects:
+      self.window.fill(self.bg_color)
     if self.render_obj:
       self.elements['MGL'].context.clear(*[self.bg_color[i] / 255 for i in range(3)], 1.0)
     self.dt = min(max(self.clock.tick(self.fps_limit) / 1000, 1 / self.fps_limit), 1)
@@ -1,7 +1,8 @@
 import pygame
-import pickle
-import gzip
-import zlib
+import time
+import copy
+
+from concurrent.futures import ThreadPoolExecutor
 
 try:
   from .tilemap     import TileSHMap
@@ -9,12 +10,16 @@ try:
   from .texmap      import TexSHMap
   from .spatialhash import LayeredSHMap
   from .elems       import Element
+  from .bakecache   import BakeCache
+  from .worldio     import MapJob, ProgressiveLoader, encode_map_data, decode_map_data, write_atomic, read_file_bytes
 except:
   from tilemap      import TileSHMap
   from decormap     import DecorSHMap
   from texmap       import TexSHMap
   from spatialhash  import LayeredSHMap
   from elems        import Element
+  from bakecache    import BakeCache
+  from worldio      import MapJob, ProgressiveLoader, encode_map_data, decode_map_data, write_atomic, read_file_bytes
 
 
 class World(Element):
@@ -25,18 +30,45 @@ class World(Element):
     self._texture_map : LayeredSHMap  = LayeredSHMap(TexSHMap, chunk_width, tile_size)
     self._decor_map   : LayeredSHMap  = LayeredSHMap(DecorSHMap, chunk_width, tile_size)
 
+    # opt-in flattening of a range of render layers into one surface per chunk
+    self._composite_range : tuple[int, int]  = None
+    self._composite_cache : dict[str, tuple] = {}
+    self.composite_limit  : int              = 256
+
+    self._executor : ThreadPoolExecutor = None
+    self._jobs     : list[MapJob]       = []
+    self._loader   : ProgressiveLoader  = None
+
   @property
   def texture_layer(self) -> str:
     return self._texture_map.layer
 
+  def get_hashmaps(self) -> dict:
+    'returns every spatial hash of the world keyed by name'
+    hashmaps = {'tile':self._tile_map}
+    for i, layer in enumerate(['bg', 'mg', 'fg']):
+      hashmaps[f'texture.{layer}'] = self._texture_map.get_layer(i)
+      hashmaps[f'decor.{layer}'] = self._decor_map.get_layer(i)
+    return hashmaps
+
   # tilemap operations ---------------------------------------------------------
 
   def add_tile(self, worldx:float, worldy:float) -> None:
+    self._ensure_point(worldx, worldy)
     self._tile_map.add_tile(worldx, worldy)
 
   def del_tile(self, worldx:float, worldy:float):
+    self._ensure_point(worldx, worldy)
     self._tile_map.del_tile(worldx, worldy)
 
+  def fill_tiles(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list:
+    'bucket fills the empty region connected to worldx, worldy with collision tiles and returns its spans, finishing chunks still streaming in as the search reaches them'
+    return self._tile_map.fill_region(worldx, worldy, bounds, limit)
+
+  def del_tiles(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list:
+    'deletes the collision tiles connected to worldx, worldy and returns their spans, finishing chunks still streaming in as the search reaches them'
+    return self._tile_map.del_region(worldx, worldy, bounds, limit)
+
   def get_terrain(self, query:pygame.Rect) -> list:
     return self._tile_map.get_terrain(query)
   
@@ -46,17 +78,34 @@ class World(Element):
   # texturemap operations -----------------------------------------------------
 
   def add_texture(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int) -> None:
+    self._ensure_point(worldx, worldy)
     self._texture_map.add_tile(worldx, worldy, sheet_id, tex_row, tex_col)
 
   def del_texture(self, worldx:float, worldy:float):
+    self._ensure_point(worldx, worldy)
     self._texture_map.del_tile(worldx, worldy)
 
+  def fill_textures(self, worldx:float, worldy:float, sheet_id:int, tex_row:int, tex_col:int, bounds:pygame.Rect=None, limit:int=65536) -> list:
+    'bucket fills the region of matching textures connected to worldx, worldy in the current layer and returns its spans, finishing chunks still streaming in as the search reaches them'
+    return self._texture_map.fill_region(worldx, worldy, sheet_id, tex_row, tex_col, bounds, limit)
+
+  def del_textures(self, worldx:float, worldy:float, bounds:pygame.Rect=None, limit:int=65536) -> list:
+    'deletes the region of matching textures connected to worldx, worldy in the current layer and returns its spans, finishing chunks still streaming in as the search reaches them'
+    return self._texture_map.del_region(worldx, worldy, bounds, limit)
+
   def check_texture(self, worldx:float, worldy:float) -> bool:
+    self._ensure_point(worldx, worldy)
     return self._texture_map.check_tile(worldx, worldy)
 
   def update_texture(self, worldx:float, worldy:float, bitmask:int, variant:int):
+    self._ensure_point(worldx, worldy)
     self._texture_map.update_tile_texture(worldx, worldy, bitmask, variant)
 
+  def set_bake_cache(self, bake_cache:BakeCache) -> None:
+    'loads rendered texture chunks from and stores them to an on-disk cache, none to disable'
+    for i in range(3):
+      self._texture_map.get_layer(i).set_bake_cache(bake_cache)
+
   def increment_texture_layer(self):
     self._texture_map.increment_editing_layer()
 
@@ -73,48 +122,278 @@ class World(Element):
 
   # world operations -----------------------------------------------------------
 
-  def get_map(self, query:pygame.Rect):
-    texture_layers = self._texture_map.get_map(query)
-    decor_layers = self._decor_map.get_map(query)
+  def set_composite_layers(self, start:int=0, end:int=1) -> None:
+    'flattens the texture and decor layers <start> through <end> (0 background, 2 foreground) into one cached surface per chunk in get_map'
+    if not 0 <= start <= end <= 2:
+      raise ValueError(f'composite layers {start} through {end} are not a range within 0 through 2')
+
+    self._composite_range = (start, end)
+    self._composite_cache.clear()
+
+  def clear_composite_layers(self) -> None:
+    'stops compositing layers in get_map and releases the cached surfaces'
+    self._composite_range = None
+    self._composite_cache.clear()
+
+  def _get_composite(self, query:pygame.Rect, start:int, end:int) -> list:
+    'returns list of (point2d, pygame.Surface) of the flattened layers <start> through <end> in the query region'
+    layer_maps = []
+    for i in range(start, end + 1):
+      layer_maps.append(self._texture_map.get_layer(i))
+      layer_maps.append(self._decor_map.get_layer(i))
+
+    tags = {}
+    for layer_map in layer_maps:
+      tags.update(dict.fromkeys(layer_map.get_chunks_in_rect(query)))
+
+    # only drop cached chunks once the cache grows past its limit, keeping the visible ones
+    if len(self._composite_cache) > self.composite_limit:
+      for tag in [tag for tag in self._composite_cache if tag not in tags]:
+        del self._composite_cache[tag]
+
+    # index of the first layer map of a stage -> (composites, animated overlays) of every chunk
+    stages = {}
+    for tag in tags:
+      chunks = [layer_map.chunks.get(tag, None) for layer_map in layer_maps]
+      versions = tuple(chunk.version if chunk != None else None for chunk in chunks)
+
+      cached = self._composite_cache.get(tag, None)
+      if cached == None or cached[0] != versions:
+        # animated textures stay out of the composite and are drawn over their own layer every frame, so the composite is split after every texture layer with any
+        segments = []
+        first = 0
+        surf = None
+        for i, chunk in enumerate(chunks):
+          if chunk == None:
+            continue
+
+          chunk_surf = chunk.get_chunk_texture()
+          if surf == None:
+            surf = pygame.Surface(chunk_surf.get_size())
+            surf.set_colorkey((0, 0, 0))
+          surf.blit(chunk_surf, (0, 0))
+
+          if i % 2 == 0 and chunk.animated:
+            segments.append((first, surf, i))
+            first = i + 1
+            surf = None
+
+        if surf != None:
+          segments.append((first, surf, None))
+
+        cached = (versions, segments)
+        self._composite_cache[tag] = cached
+
+      chunk = next(chunk for chunk in chunks if chunk != None)
+      chunk_pos = chunk.chunk_pos.copy()
+      chunk_pos.x *= chunk.chunk_size
+      chunk_pos.y *= chunk.chunk_size
+
+      for first, surf, animated in cached[1]:
+        composites, overlays = stages.setdefault(first, ([], []))
+        composites.append((chunk_pos, surf))
+        if animated != None:
+          overlays.extend(layer_maps[animated].get_animated_textures(tag, self.elements['Window'].rt))
+
+    # every chunk of a stage is drawn before the overlays on it, like the layers outside the composite
+    ordered_map = []
+    for first in sorted(stages):
+      ordered_map.extend(stages[first][0] + stages[first][1])
+    return ordered_map
 
+  def get_map(self, query:pygame.Rect):
     ordered_map = []
     for i in range(3):
-      ordered_map.extend(texture_layers[i])
-      ordered_map.extend(decor_layers[i])
+      # the composited range is drawn once in place of its first layer
+      if self._composite_range != None:
+        start, end = self._composite_range
+        if i == start:
+          ordered_map.extend(self._get_composite(query, start, end))
+        if start <= i <= end:
+          continue
+
+      ordered_map.extend(self._texture_map.get_layer(i).get_terrain(query))
+      ordered_map.extend(self._decor_map.get_layer(i).get_terrain(query))
 
     return ordered_map
   
-  def save_map(self, path:str):
-    tile_data = self._tile_map.get_save_data()
-    texture_data = self._texture_map.get_save_data()
-    decor_data = self._decor_map.get_save_data()
-
-    data = {
-      'tile':tile_data,
-      'texture':texture_data,
-      'decor':decor_data
+  def _get_executor(self) -> ThreadPoolExecutor:
+    'returns the worker that saves and loads maps in the background'
+    if self._executor == None:
+      self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='world-io')
+    return self._executor
+
+  def snapshot(self) -> 'World':
+    'returns a read-only copy of the world for other threads to read, later edits to this world do not affect it. chunks still streaming in are finished first'
+    if self._loader != None:
+      self._loader.ensure_region()
+    return self._snapshot()
+
+  def _snapshot(self) -> 'World':
+    'returns a read-only copy of the world as it is, without the chunks still streaming in'
+    world = copy.copy(self)
+    world._tile_map = self._tile_map.snapshot()
+    world._texture_map = self._texture_map.snapshot()
+    world._decor_map = self._decor_map.snapshot()
+    world._composite_cache = {}
+    world._executor = None
+    world._jobs = []
+    world._loader = None
+    return world
+
+  def get_save_data(self) -> dict:
+    'returns a saveable object with enough data to reconstruct the world'
+    return {
+      'tile':self._tile_map.get_save_data(),
+      'texture':self._texture_map.get_save_data(),
+      'decor':self._decor_map.get_save_data()
     }
 
-    print(data)
-    import sys
+  def intern_chunks(self) -> None:
+    'shares one grid between every tile and texture chunk with the same contents, rendered surfaces are shared too'
+    self._tile_map.intern_chunks()
+    self._texture_map.intern_chunks()
 
-    pickle_size = sys.getsizeof(pickle.dumps(tile_data))
-    pickle_size += sys.getsizeof(pickle.dumps(texture_data))
-    pickle_size += sys.getsizeof(pickle.dumps(decor_data))
-
-    print(f'COMPRESSED SIZE: {sys.getsizeof(zlib.compress(pickle.dumps(data)))}')
-    print(f'SERIALIZED SIZE: {pickle_size}')
-
-    with gzip.open(path, 'wb') as f:
-      f.write(zlib.compress(pickle.dumps(data)))
-
-  def load_map(self, path:str):
+  def set_cold_chunks(self, frames:int=None, seconds:float=None, budget:int=64) -> None:
+    'compresses tile and texture chunks in memory once they go unused for <frames> updates and <seconds>, both none turns it off'
+    self._tile_map.set_cold_chunks(frames, seconds, budget)
+    for i in range(3):
+      self._texture_map.get_layer(i).set_cold_chunks(frames, seconds, budget)
+
+  def _ensure_point(self, worldx:float, worldy:float) -> None:
+    'finishes streaming in the chunks at worldx, worldy before they are edited'
+    if self._loader != None:
+      self._loader.ensure_region(pygame.Rect(worldx, worldy, 1, 1))
+
+  def _cancel_loading(self) -> None:
+    'stops streaming in chunks of the previously loaded map'
+    if self._loader != None:
+      self._loader.cancel()
+      self._loader = None
+
+  def save_map(self, path:str) -> dict:
+    'saves the world to path, blocking until written, and returns the save stats'
+    job = self.save_map_async(path)
+    job.result()
+    return job.stats
+
+  def save_map_async(self, path:str, callback:callable=None) -> MapJob:
+    'saves the world to path from a background worker and returns the job, callback(job) is called from update once it finishes'
+    job = MapJob(path, 'save', callback)
+
+    # taking the snapshot is the only work done on the calling thread, chunks still streaming in are saved from the loaded save data
+    snapshot = self._snapshot()
+    unloaded = self._loader.get_unloaded() if self._loader != None else {}
+
+    def save() -> None:
+      start = time.perf_counter()
+      job.set_stage('encoding', 0)
+      data = {}
+      for i, (key, hashmap) in enumerate([('tile', snapshot._tile_map), ('texture', snapshot._texture_map), ('decor', snapshot._decor_map)]):
+        data[key] = hashmap.get_save_data()
+        job.set_stage('encoding', (i + 1) / 5)
+
+      for name, chunk_data in unloaded.items():
+        hashmap_data = data['tile'] if name == 'tile' else data['texture'][name.split('.')[1]]
+        hashmap_data['data'].update(chunk_data)
+      job.stats['encode_time'] = time.perf_counter() - start
+
+      job.set_stage('compressing', 3 / 5)
+      contents = encode_map_data(data, job)
+
+      job.set_stage('writing', 4 / 5)
+      write_start = time.perf_counter()
+      write_atomic(path, contents)
+      job.stats['write_time'] = time.perf_counter() - write_start
+      job.stats['total_time'] = time.perf_counter() - start
+      job.set_stage('done', 1)
+
+    job.future = self._get_executor().submit(save)
+    self._jobs.append(job)
+    return job
+
+  def _apply_save_data(self, data:dict) -> None:
+    'replaces the world contents with save data'
+    self._cancel_loading()
+    self._tile_map.load_from_data(data['tile'])
+    self._texture_map.load_from_data(data['texture'])
+    self._decor_map.load_from_data(data['decor'])
+    self._composite_cache.clear()
+
+  def load_map(self, path:str) -> None:
+    'loads the world from path, blocking until loaded'
+    self._apply_save_data(decode_map_data(read_file_bytes(path)))
+
+  def load_map_async(self, path:str, callback:callable=None) -> MapJob:
+    'reads and decompresses the world at path from a background worker, the world is replaced on the first update after it finishes'
+    job = MapJob(path, 'load', callback)
+
+    def load() -> dict:
+      start = time.perf_counter()
+      job.set_stage('reading', 0)
+      contents = read_file_bytes(path)
+
+      job.set_stage('decoding', 1 / 3)
+      data = decode_map_data(contents)
+      job.stats['compressed_size'] = len(contents)
+      job.stats['decode_time'] = time.perf_counter() - start
+
+      job.set_stage('applying', 2 / 3)
+      return data
+
+    job.future = self._get_executor().submit(load)
+    self._jobs.append(job)
+    return job
+
+  def load_map_progressive(self, path:str, query:pygame.Rect) -> None:
+    'loads the chunks of the world at path intersecting query before returning and streams in the rest from a background thread'
+    data = decode_map_data(read_file_bytes(path))
+    self._cancel_loading()
+    self._composite_cache.clear()
+
+    # decor is stored once per map rather than per chunk so it is loaded up front
+    self._decor_map.load_from_data(data['decor'])
+
+    hashmaps = self.get_hashmaps()
+    save_data = {'tile':data['tile']}
+    for layer in ['bg', 'mg', 'fg']:
+      save_data[f'texture.{layer}'] = data['texture'][layer]
+
+    streamed = {}
+    for name in save_data:
+      streamed[name] = hashmaps[name]
+      streamed[name].clear_chunks()
+
+    self._loader = ProgressiveLoader(streamed, save_data, query.center)
+    self._loader.ensure_region(query)
+    self._loader.start()
+
+  def is_region_ready(self, query:pygame.Rect) -> bool:
+    'returns boolean if every chunk in the query region has finished loading'
+    return self._loader == None or self._loader.is_region_ready(query)
+
+  def ensure_region(self, query:pygame.Rect) -> None:
+    'finishes loading every chunk in the query region before returning'
+    if self._loader != None:
+      self._loader.ensure_region(query)
+
+  def update(self) -> None:
+    'called every frame, finishes background loads on the calling thread, reports finished jobs and compresses cold chunks'
+    if self._loader != None:
+      self._loader.update()
+      if self._loader.done:
+        self._loader = None
+
+    self._tile_map.update()
+    for i in range(3):
+      self._texture_map.get_layer(i).update()
 
-    with gzip.open(path, 'rb') as f:
-      data = pickle.loads(zlib.decompress(f.read()))
+    for job in [job for job in self._jobs if job.done()]:
+      self._jobs.remove(job)
 
-      print(data)
+      if job.kind == 'load' and job.future.exception() == None:
+        self._apply_save_data(job.result())
+        job.set_stage('done', 1)
 
-      self._tile_map.load_from_data(data['tile'])
-      self._texture_map.load_from_data(data['texture'])
-      self._decor_map.load_from_data(data['decor'])
\ No newline at end of file
+      if job.callback != None:
+        job.callback(job)
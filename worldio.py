@@ -0,0 +1,232 @@
+import pickle
+import gzip
+import zlib
+import time
+import os
+import queue
+import threading
+import functools
+
+from concurrent.futures import Future
+from typing import Any
+
+try:
+  from .elems import Element
+except:
+  from elems  import Element
+
+class MapJob(Element):
+  'handle to a map save or load running in the background, reports progress and compression stats'
+
+  def __init__(self, path:str, kind:str, callback:callable=None):
+    super().__init__()
+    self.path     : str      = path
+    self.kind     : str      = kind
+    self.callback : callable = callback
+    self.stage    : str      = 'queued'
+    self.progress : float    = 0
+    self.stats    : dict     = {}
+    self.future   : Future   = None
+
+  def set_stage(self, stage:str, progress:float) -> None:
+    'called by the worker to report what it is doing and how far along it is, from 0 to 1'
+    self.stage = stage
+    self.progress = progress
+
+  def done(self) -> bool:
+    'returns boolean if the job has finished, successfully or not'
+    return self.future != None and self.future.done()
+
+  def result(self, timeout:float=None) -> Any:
+    'waits for the job to finish and returns its result, raising any error from the worker'
+    return self.future.result(timeout)
+
+def encode_map_data(data:Any, job:MapJob=None, compresslevel:int=6) -> bytes:
+  'returns the compressed file contents of map save data, filling in the job stats if given'
+  start = time.perf_counter()
+  raw = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+  pickled = time.perf_counter()
+  compressed = gzip.compress(raw, compresslevel=compresslevel)
+
+  if job != None:
+    job.stats.update({
+      'raw_size':len(raw),
+      'compressed_size':len(compressed),
+      'ratio':len(compressed) / max(len(raw), 1),
+      'pickle_time':pickled - start,
+      'compress_time':time.perf_counter() - pickled
+    })
+
+  return compressed
+
+def decode_map_data(compressed:bytes) -> Any:
+  'returns map save data from compressed file contents, also reads saves that were zlib compressed inside the gzip'
+  raw = gzip.decompress(compressed)
+
+  # older saves compressed the pickle with zlib before gzip, zlib streams start with 0x78
+  if raw[:1] == b'\x78':
+    raw = zlib.decompress(raw)
+
+  return pickle.loads(raw)
+
+def write_atomic(path:str, contents:bytes) -> None:
+  'writes contents to a temporary file and renames it over path so readers never see a partial file'
+  tmp_path = f'{path}.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(contents)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+
+def read_file_bytes(path:str) -> bytes:
+  'returns the contents of a file as bytes'
+  with open(path, 'rb') as f:
+    return f.read()
+
+class ProgressiveLoader(Element):
+  'builds the chunks of loaded save data on a background thread, nearest to a focus point first'
+
+  def __init__(self, hashmaps:dict, save_data:dict, focus:tuple[float, float]):
+    super().__init__()
+    self.hashmaps  : dict           = hashmaps
+    self.save_data : dict           = save_data
+    self.pending   : dict           = {name:dict(data['data']) for name, data in save_data.items()}
+    self.loading   : dict           = {name:set(data['data']) for name, data in save_data.items()}
+    self.ready     : queue.Queue    = queue.Queue()
+    self.lock      : threading.Lock = threading.Lock()
+    self.cancelled : bool           = False
+
+    # what stopped the background thread, it posts none to ready after it so waiters wake up
+    self.error     : Exception      = None
+
+    self.order : list = []
+    for name, hashmap in hashmaps.items():
+      fx, fy = hashmap.get_chunk_pos(*focus)
+      for chunk_tag in self.pending[name]:
+        x, y = hashmap._unformat_chunk_tag(chunk_tag)
+        self.order.append(((x - fx) ** 2 + (y - fy) ** 2, name, chunk_tag))
+    self.order.sort()
+
+    self.thread : threading.Thread = threading.Thread(target=self._run, name='world-stream', daemon=True)
+
+    # region searches finish the chunks they reach instead of reading them as empty
+    for name, hashmap in hashmaps.items():
+      hashmap.chunk_source = functools.partial(self.ensure_chunk, name) if self.loading[name] else None
+
+  @property
+  def done(self) -> bool:
+    'returns boolean if every chunk has been added to its spatial hash'
+    return not any(self.loading.values())
+
+  def start(self) -> None:
+    'starts building the remaining chunks in the background'
+    self.thread.start()
+
+  def cancel(self) -> None:
+    'stops the background thread after the chunk it is building'
+    self.cancelled = True
+    for hashmap in self.hashmaps.values():
+      hashmap.chunk_source = None
+
+  def _take(self, name:str, chunk_tag:str) -> Any:
+    'removes and returns the save data of a chunk nobody has started building, otherwise returns none'
+    with self.lock:
+      return self.pending[name].pop(chunk_tag, None)
+
+  def _build(self, name:str, chunk_tag:str, chunk_data:Any) -> Any:
+    'returns the chunk built from its save data'
+    data = self.save_data[name]
+    hashmap = self.hashmaps[name]
+    return hashmap.build_chunk(chunk_tag, hashmap.get_chunk_body(data, chunk_data), data['width'], data['size'])
+
+  def _run(self) -> None:
+    try:
+      for _, name, chunk_tag in self.order:
+        if self.cancelled:
+          return
+
+        chunk_data = self._take(name, chunk_tag)
+        if chunk_data == None:
+          continue
+
+        self.ready.put((name, chunk_tag, self._build(name, chunk_tag, chunk_data)))
+    except Exception as error:
+      self.error = error
+      self.ready.put(None)
+
+  def _get(self, block:bool) -> tuple:
+    'returns the next (name, chunk tag, chunk) built by the background thread, raising the error it stopped on once every chunk it built before is taken'
+    item = self.ready.get(block)
+    if item == None:
+      # left in the queue so every later call raises too
+      self.ready.put(None)
+      raise RuntimeError('building chunks in the background failed') from self.error
+    return item
+
+  def _add(self, name:str, chunk_tag:str, chunk:Any) -> None:
+    'adds a built chunk to its spatial hash, interning it on the calling thread'
+    self.hashmaps[name].intern_chunk(chunk)
+    self.hashmaps[name].chunks[chunk_tag] = chunk
+    self.hashmaps[name].mark_changed(chunk_tag)
+    self.loading[name].discard(chunk_tag)
+    if not self.loading[name]:
+      self.hashmaps[name].chunk_source = None
+
+  def update(self) -> None:
+    'called every frame, adds the chunks built since the last update to their spatial hashes'
+    while True:
+      try:
+        self._add(*self._get(False))
+      except queue.Empty:
+        return
+
+  def _get_loading_tags(self, query:Any) -> list[tuple[str, str]]:
+    'returns (name, chunk tag) of every chunk in the query region not yet added to its spatial hash, every chunk if query is none'
+    tags = []
+    for name, hashmap in self.hashmaps.items():
+      if query == None:
+        tags.extend((name, chunk_tag) for chunk_tag in self.loading[name])
+        continue
+
+      for chunk_tag in hashmap.get_chunks_in_rect(query, include_empty=True):
+        if chunk_tag in self.loading[name]:
+          tags.append((name, chunk_tag))
+    return tags
+
+  def is_region_ready(self, query:Any) -> bool:
+    'returns boolean if every chunk in the query region has been added to its spatial hash'
+    self.update()
+    return self._get_loading_tags(query) == []
+
+  def get_unloaded(self) -> dict[str, dict[str, Any]]:
+    'returns hash name -> chunk tag -> save data of every chunk not yet added to its spatial hash, taken from the loaded save data without building anything'
+    unloaded = {}
+    for name, chunk_tags in self.loading.items():
+      data = self.save_data[name]
+      unloaded[name] = {chunk_tag:self.hashmaps[name].get_chunk_body(data, data['data'][chunk_tag]) for chunk_tag in chunk_tags}
+    return unloaded
+
+  def ensure_chunk(self, name:str, chunk_tag:str) -> None:
+    'builds chunk <chunk_tag> of hash <name> on the calling thread if it has not been added yet, waiting on it if the background thread is building it'
+    if chunk_tag not in self.loading[name]:
+      return
+
+    chunk_data = self._take(name, chunk_tag)
+    if chunk_data != None:
+      self._add(name, chunk_tag, self._build(name, chunk_tag, chunk_data))
+      return
+
+    while chunk_tag in self.loading[name]:
+      self._add(*self._get(True))
+
+  def ensure_region(self, query:Any=None) -> None:
+    'builds every chunk in the query region on the calling thread, waiting on any the background thread is building. every chunk if query is none'
+    self.update()
+    for name, chunk_tag in self._get_loading_tags(query):
+      chunk_data = self._take(name, chunk_tag)
+      if chunk_data != None:
+        self._add(name, chunk_tag, self._build(name, chunk_tag, chunk_data))
+
+    # whatever is left is being built by the background thread right now
+    while self._get_loading_tags(query) != []:
+      self._add(*self._get(True))